@@ -1,11 +1,11 @@
 import numpy as np
-import pandas as pd
 import yaml
 from typing import List, Optional
 from june.demography.geography import Areas, SuperArea, SuperAreas, Geography
 
 from .social_venue import SocialVenue, SocialVenues, SocialVenueError
 from .social_venue_distributor import SocialVenueDistributor
+from .venue_table import TableBackedVenues, VenueTable
 from june.paths import data_path, configs_path
 
 default_cinemas_coordinates_filename = data_path / "input/leisure/cinemas_per_super_area.csv"
@@ -21,7 +21,9 @@ class Cinema(SocialVenue):
         super().__init__()
 
 
-class Cinemas(SocialVenues):
+class Cinemas(TableBackedVenues, SocialVenues):
+    venue_class = Cinema
+
     def __init__(self, cinemas, make_tree:bool = True):
         super().__init__(cinemas)
         if len(cinemas) != 0 and make_tree:
@@ -33,12 +35,9 @@ class Cinemas(SocialVenues):
         super_areas: List[SuperArea],
         coordinates_filename: str = default_cinemas_coordinates_filename,
     ):
-        cinemas_per_super_area = pd.read_csv(coordinates_filename)
         sa_names = [super_area.name for super_area in super_areas]
-        cinemas_coordinates = cinemas_per_super_area.loc[
-            cinemas_per_super_area.super_area.isin(sa_names), ["lat", "lon"]
-        ]
-        return cls.from_coordinates(cinemas_coordinates.values)
+        table = VenueTable.from_csv(coordinates_filename).for_super_areas(sa_names)
+        return cls.from_table(table)
 
     @classmethod
     def for_areas(
@@ -57,12 +56,7 @@ class Cinemas(SocialVenues):
 
     @classmethod
     def from_coordinates(cls, coordinates: List[np.array], **kwargs):
-        social_venues = list()
-        for coord in coordinates:
-            sv = Cinema()
-            sv.coordinates = coord
-            social_venues.append(sv)
-        return cls(social_venues, **kwargs)
+        return cls.from_table(VenueTable(coordinates), **kwargs)
 
 
 class CinemaDistributor(SocialVenueDistributor):
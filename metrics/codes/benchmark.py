@@ -0,0 +1,287 @@
+"""
+Scaling benchmark: builds worlds on a ladder of population sizes and times world
+generation, saving and loading the world, and a simulation run with leisure and
+policies, each stage in its own process so that its peak memory is its own.
+Results are written to metrics/results/benchmark.json, the plots in metrics/plots
+are regenerated from them and, if a baseline is given, every stage slower (or
+bigger) than the baseline by more than the tolerance is flagged.
+
+    python benchmark.py --ladder 5 10 20 40 --baseline ../results/baseline.json
+    python benchmark.py --ladder 5 10 20 40 --save-baseline
+"""
+import argparse
+import json
+import platform
+import resource
+import subprocess
+import sys
+import time
+from datetime import datetime
+from multiprocessing import get_context
+from pathlib import Path
+
+import simulation
+import world_creation
+
+metrics_path = Path(__file__).resolve().parent.parent
+default_results_path = metrics_path / "results/benchmark.json"
+default_baseline_path = metrics_path / "results/baseline.json"
+default_region = "North East"
+timed_stages = ("generation_time", "to_hdf5_time", "load_time", "run_time")
+memory_stages = ("generation_rss", "load_rss", "run_rss")
+
+
+def peak_rss() -> float:
+    """
+    Peak resident set size of this process so far, in MB.
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        return peak / 1024 ** 2
+    return peak / 1024
+
+
+def in_fresh_process(stage, *args) -> dict:
+    """
+    Runs one stage in a freshly spawned process, so that its peak memory is not
+    that of the stages before it (ru_maxrss never goes down within a process).
+    """
+    with get_context("spawn").Pool(1, maxtasksperchild=1) as pool:
+        return pool.apply(stage, args)
+
+
+def generation_stage(super_areas: list, world_file: str) -> dict:
+    """
+    Times generate_world_from_geography (the geography and its groups are built
+    before the timer starts) and saving the world to world_file.
+    """
+    from june.demography.geography import Geography
+    from june.groups import CareHomes, Companies, Hospitals, Schools, Universities
+    from june.world import generate_world_from_geography
+
+    geography = Geography.from_file({"super_area": super_areas})
+    geography.hospitals = Hospitals.for_geography(geography)
+    geography.schools = Schools.for_geography(geography)
+    geography.companies = Companies.for_geography(geography)
+    geography.care_homes = CareHomes.for_geography(geography)
+    geography.universities = Universities.for_super_areas(geography.super_areas)
+    start = time.perf_counter()
+    world = generate_world_from_geography(
+        geography, include_households=True, include_commute=True
+    )
+    result = {"generation_time": time.perf_counter() - start}
+    result["generation_rss"] = peak_rss()
+    result["population"] = len(world.people)
+
+    start = time.perf_counter()
+    world.to_hdf5(world_file)
+    result["to_hdf5_time"] = time.perf_counter() - start
+    return result
+
+
+def load_stage(world_file: str) -> dict:
+    """
+    Times loading the world saved by generation_stage.
+    """
+    from june.world import generate_world_from_hdf5
+
+    start = time.perf_counter()
+    generate_world_from_hdf5(world_file)
+    return {"load_time": time.perf_counter() - start, "load_rss": peak_rss()}
+
+
+def run_stage(
+    world_file: str, save_path: str, config_filename: str, n_cases: int
+) -> dict:
+    """
+    Times a simulation of the saved world with leisure and the default policies, as
+    in quickstart.py; the world, venues and simulator are set up before the timer
+    starts.
+    """
+    from june.groups import Cemeteries
+    from june.groups.leisure import (
+        Cinemas,
+        Groceries,
+        Pubs,
+        generate_leisure_for_config,
+    )
+    from june.infection.infection import InfectionSelector
+    from june.infection_seed import InfectionSeed
+    from june.interaction import Interaction
+    from june.policy import Policies
+    from june.simulator import Simulator
+    from june.world import generate_world_from_hdf5
+
+    world = generate_world_from_hdf5(world_file)
+    world.cinemas = Cinemas.for_super_areas(world.super_areas)
+    world.pubs = Pubs.for_super_areas(world.super_areas)
+    world.groceries = Groceries.for_super_areas(
+        world.super_areas, venues_per_capita=1 / 500
+    )
+    world.cemeteries = Cemeteries()
+    selector = InfectionSelector.from_file()
+    interaction = Interaction.from_file()
+    infection_seed = InfectionSeed(world.super_areas, selector)
+    infection_seed.unleash_virus(n_cases)
+    leisure = generate_leisure_for_config(world=world, config_filename=config_filename)
+    simulator = Simulator.from_file(
+        world,
+        interaction,
+        selector,
+        policies=Policies.from_file(),
+        leisure=leisure,
+        config_filename=config_filename,
+        save_path=save_path,
+        seed=0,
+    )
+    start = time.perf_counter()
+    simulator.run()
+    return {
+        "run_time": time.perf_counter() - start,
+        "run_rss": peak_rss(),
+        "days": simulator.timer.total_days,
+    }
+
+
+def benchmark_world(
+    super_areas: list, work_path: str, config_filename: str, n_cases: int
+) -> dict:
+    """
+    Runs every stage on the world of the given super areas, each in its own
+    process: the peak memory of a stage is that of its process, including the
+    setup it needs (e.g. the geography for the generation, the world for the run).
+    """
+    world_file = str(Path(work_path) / f"world_{len(super_areas)}.hdf5")
+    save_path = str(Path(work_path) / f"results_{len(super_areas)}")
+    result = {"n_super_areas": len(super_areas)}
+    result.update(in_fresh_process(generation_stage, super_areas, world_file))
+    result.update(in_fresh_process(load_stage, world_file))
+    result.update(
+        in_fresh_process(run_stage, world_file, save_path, config_filename, n_cases)
+    )
+    return result
+
+
+def run_ladder(
+    ladder: list,
+    region: str,
+    work_path: str,
+    config_filename: str,
+    n_cases: int,
+) -> list:
+    """
+    Benchmarks the worlds of the first n super areas of the region for every n of
+    the ladder.
+    """
+    from june.demography.geography_cache import GeographyCache
+
+    super_areas = list(GeographyCache.from_file().super_areas_for({"region": [region]}))
+    Path(work_path).mkdir(parents=True, exist_ok=True)
+    results = []
+    for n_super_areas in ladder:
+        result = benchmark_world(
+            super_areas[:n_super_areas], work_path, config_filename, n_cases
+        )
+        print(
+            f"{result['population']} people: "
+            + ", ".join(f"{stage}={result[stage]:.1f}s" for stage in timed_stages)
+            + ", peak rss="
+            + ", ".join(f"{stage}={result[stage]:.0f}MB" for stage in memory_stages)
+        )
+        results.append(result)
+    return results
+
+
+def metadata(region: str, n_cases: int, config_filename: str) -> dict:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "date": datetime.now().isoformat(timespec="seconds"),
+        "commit": commit,
+        "machine": platform.node(),
+        "python": platform.python_version(),
+        "region": region,
+        "n_cases": n_cases,
+        "config": str(config_filename),
+    }
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """
+    Stages of the ladder rungs present in both results that are slower or use more
+    memory than the baseline by more than a fraction tolerance.
+    """
+    baseline_rungs = {rung["n_super_areas"]: rung for rung in baseline["results"]}
+    regressions = []
+    for rung in results["results"]:
+        reference = baseline_rungs.get(rung["n_super_areas"])
+        if reference is None:
+            continue
+        for stage in timed_stages + memory_stages:
+            if stage not in rung or not reference.get(stage):
+                continue
+            ratio = rung[stage] / reference[stage]
+            if ratio > 1 + tolerance:
+                regressions.append(
+                    f"{rung['population']} people, {stage}: "
+                    f"{rung[stage]:.1f} vs {reference[stage]:.1f} ({ratio:.2f}x)"
+                )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--ladder", type=int, nargs="+", default=[5, 10, 20, 40],
+        help="numbers of super areas of the worlds",
+    )
+    parser.add_argument("--region", default=default_region)
+    parser.add_argument("--config", default=None, help="simulator config file")
+    parser.add_argument("--n-cases", type=int, default=50)
+    parser.add_argument("--work-path", default="benchmark_worlds")
+    parser.add_argument("--output", default=default_results_path, type=Path)
+    parser.add_argument("--baseline", default=None, type=Path)
+    parser.add_argument("--tolerance", type=float, default=0.1)
+    parser.add_argument(
+        "--save-baseline", action="store_true",
+        help=f"also store the results as {default_baseline_path}",
+    )
+    args = parser.parse_args()
+    if args.config is None:
+        from june.simulator import default_config_filename
+
+        args.config = default_config_filename
+
+    results = {
+        "metadata": metadata(args.region, args.n_cases, args.config),
+        "results": run_ladder(
+            args.ladder, args.region, args.work_path, args.config, args.n_cases
+        ),
+    }
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    if args.save_baseline:
+        with open(default_baseline_path, "w") as f:
+            json.dump(results, f, indent=2)
+
+    world_creation.plot(results["results"])
+    simulation.plot(results["results"])
+
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions above {args.tolerance:.0%} against {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
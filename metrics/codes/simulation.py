@@ -1,7 +1,13 @@
+import json
+import sys
+from pathlib import Path
+
 import numpy as np
 import matplotlib
 import matplotlib.pyplot as plt
 
+metrics_path = Path(__file__).resolve().parent.parent
+
 def c_of_d(ys_orig, ys_line):
     """Compute the line R squared."""
     y_mean_line = [np.mean(ys_orig) for y in ys_orig]
@@ -27,26 +33,40 @@ def get_linear_parameters(x, y):
 
     return poly1d_fn(x), R, y_err, slope, d_time, R0
 
-pop_time = np.array([80., 103., 136., 162., ])
-pop = np.array([81875., 107422., 141616., 168950., ])
-mem = np.array([125., 132., 145., 160., ])
-
-lin_pars_t = get_linear_parameters(pop_time, pop)
-lin_pars_mem = get_linear_parameters(mem, pop)
-plot_text_t = "Time\nSlope: %.2f pop/s;\ngoodness of fit: %.2f" % (lin_pars_t[3],
-                                                                   lin_pars_t[1])
-plot_text_mem = "Memory\nSlope: %.2f pop/10M;\ngoodness of fit: %.2f" % (lin_pars_mem[3],
-                                                                       lin_pars_mem[1])
-
-plt.scatter(pop_time, pop, label="time")
-plt.plot(pop_time, pop)
-plt.scatter(mem, pop, label="mem")
-plt.plot(mem, lin_pars_mem[0])
-plt.grid()
-plt.ylabel("Population size")
-plt.xlabel("Time[s]/maxMem[10M] $simulator.run()$")
-plt.title("Simulator: population vs runtime/maxMem (20 days)")
-plt.text(80., 150000, plot_text_t, fontsize=9, color='k')
-plt.text(80., 130000, plot_text_mem, fontsize=9, color='k')
-plt.legend()
-plt.savefig("../plots/simulator_timing.png")
+def plot(results, output=metrics_path / "plots/simulator_timing.png"):
+    """Plot population vs run time and peak memory of the benchmark.py results."""
+    results = [rung for rung in results if rung.get("run_time")]
+    pop_time = np.array([rung["run_time"] for rung in results])
+    pop = np.array([rung["population"] for rung in results], dtype=float)
+    mem = np.array([rung["run_rss"] / 10. for rung in results])  # 10M units
+    days = results[0].get("days", "") if results else ""
+
+    lin_pars_t = get_linear_parameters(pop_time, pop)
+    lin_pars_mem = get_linear_parameters(mem, pop)
+    plot_text_t = "Time\nSlope: %.2f pop/s;\ngoodness of fit: %.2f" % (lin_pars_t[3],
+                                                                       lin_pars_t[1])
+    plot_text_mem = "Memory\nSlope: %.2f pop/10M;\ngoodness of fit: %.2f" % (lin_pars_mem[3],
+                                                                           lin_pars_mem[1])
+
+    plt.figure()
+    plt.scatter(pop_time, pop, label="time")
+    plt.plot(pop_time, lin_pars_t[0])
+    plt.scatter(mem, pop, label="mem")
+    plt.plot(mem, lin_pars_mem[0])
+    plt.grid()
+    plt.ylabel("Population size")
+    plt.xlabel("Time[s]/maxMem[10M] $simulator.run()$")
+    plt.title("Simulator: population vs runtime/maxMem (%s days)" % days)
+    ax = plt.gca()
+    plt.text(0.05, 0.85, plot_text_t, fontsize=9, color='k', transform=ax.transAxes)
+    plt.text(0.05, 0.65, plot_text_mem, fontsize=9, color='k', transform=ax.transAxes)
+    plt.legend()
+    plt.savefig(output)
+    plt.close()
+
+
+if __name__ == "__main__":
+    results_path = sys.argv[1] if len(sys.argv) > 1 else \
+        metrics_path / "results/benchmark.json"
+    with open(results_path) as f:
+        plot(json.load(f)["results"])
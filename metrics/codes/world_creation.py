@@ -1,7 +1,13 @@
+import json
+import sys
+from pathlib import Path
+
 import numpy as np
 import matplotlib
 import matplotlib.pyplot as plt
 
+metrics_path = Path(__file__).resolve().parent.parent
+
 def c_of_d(ys_orig, ys_line):
     """Compute the line R squared."""
     y_mean_line = [np.mean(ys_orig) for y in ys_orig]
@@ -27,18 +33,31 @@ def get_linear_parameters(x, y):
 
     return poly1d_fn(x), R, y_err, slope, d_time, R0
 
-pop_time = np.array([33., 40., 51., 57., ])
-pop = np.array([63277., 94298., 141616., 168950., ])
-
-lin_pars = get_linear_parameters(pop_time, pop)
-plot_text = "Slope: %.2f pop/s;\ngoodness of fit: %.2f" % (lin_pars[3],
-                                                           lin_pars[1]) 
-
-plt.scatter(pop_time, pop)
-plt.plot(pop_time, pop)
-plt.grid()
-plt.ylabel("Population size")
-plt.xlabel("Time $generate\_world\_from\_geography()$ [s]")
-plt.title("World generation: population vs runtime")
-plt.text(35., 150000, plot_text, fontsize=9, color='k')
-plt.savefig("../plots/world_creation_timing.png")
+def plot(results, output=metrics_path / "plots/world_creation_timing.png"):
+    """Plot population vs generation time of the benchmark.py results."""
+    results = [rung for rung in results if rung.get("generation_time")]
+    pop_time = np.array([rung["generation_time"] for rung in results])
+    pop = np.array([rung["population"] for rung in results], dtype=float)
+
+    lin_pars = get_linear_parameters(pop_time, pop)
+    plot_text = "Slope: %.2f pop/s;\ngoodness of fit: %.2f" % (lin_pars[3],
+                                                               lin_pars[1])
+
+    plt.figure()
+    plt.scatter(pop_time, pop)
+    plt.plot(pop_time, lin_pars[0])
+    plt.grid()
+    plt.ylabel("Population size")
+    plt.xlabel("Time $generate\_world\_from\_geography()$ [s]")
+    plt.title("World generation: population vs runtime")
+    plt.text(0.05, 0.85, plot_text, fontsize=9, color='k',
+             transform=plt.gca().transAxes)
+    plt.savefig(output)
+    plt.close()
+
+
+if __name__ == "__main__":
+    results_path = sys.argv[1] if len(sys.argv) > 1 else \
+        metrics_path / "results/benchmark.json"
+    with open(results_path) as f:
+        plot(json.load(f)["results"])
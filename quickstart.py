@@ -9,6 +9,7 @@ import seaborn as sns
 sns.set_context('notebook')
 from june import World 
 from june.demography.geography import Geography
+from june.demography.geography_cache import GeographyCache
 from june.demography import Demography
 #from june.interaction import ContactAveraging
 from june.interaction import Interaction
@@ -21,12 +22,12 @@ from june.simulator import Simulator
 from june.infection_seed import InfectionSeed
 from june.policy import Policy, Policies
 from june import paths
-from june.hdf5_savers import load_geography_from_hdf5
-from june.logger.read_logger import ReadLogger
+from june.logger.read_results import ReadResults
 from june.infection.infection import InfectionSelector
-from june.world import generate_world_from_hdf5, generate_world_from_geography
+from june.world import generate_world_from_geography
+from june.lazy_world import LazyWorld
 
-geography = Geography.from_file({"super_area": ["E02003282", "E02001720", "E00088544", "E02002560", "E02002559", "E02004314",]})
+geography = GeographyCache.from_file().geography({"super_area": ["E02003282", "E02001720", "E00088544", "E02002560", "E02002559", "E02004314",]})
 geography.hospitals = Hospitals.for_geography(geography)
 geography.schools = Schools.for_geography(geography)
 geography.companies = Companies.for_geography(geography)
@@ -37,10 +38,11 @@ world = generate_world_from_geography(geography, include_households=True, includ
 print("World length", len(world.people))
 world.to_hdf5("world.hdf5")
 
-world = generate_world_from_hdf5("world.hdf5")
+# group types are only built when first used, the geography is loaded once with the world
+world = LazyWorld("world.hdf5")
 
 # leisure
-geography = load_geography_from_hdf5("world.hdf5")
+geography = world.geography
 world.cinemas = Cinemas.for_geography(geography)
 world.pubs = Pubs.for_geography(geography)
 world.groceries = Groceries.for_super_areas(world.super_areas,
@@ -76,7 +78,8 @@ simulator = Simulator.from_file(
      world, interaction, selector, 
     config_filename = CONFIG_PATH,
     leisure = leisure,
-    policies = policies
+    policies = policies,
+    async_writer = True,
 )
 
 
@@ -89,9 +92,8 @@ simulator.run()
 
 # # Getting the results
 
-# All results are stored in a json file specified in the ``save_path`` variable in the config file. We can also access it from ``world.logger`` directly.
-import pandas as pd
-read = ReadLogger()
+# The per step results are stored in ``results.h5`` (and hospital data in ``logger.hdf5``) in the ``save_path`` directory; they are read in chunks.
+read = ReadResults()
 
 
 # ## Hospital data and how it changed over time
@@ -105,21 +107,8 @@ hospitals_characteristics_df
 # ## where did infections happen?
 loc_df = read.get_locations_infections()
 
-locations_per_day = read.locations_df.groupby(pd.Grouper(freq='D')).sum()
-
-all_infection_places = set(locations_per_day.location.sum())
-
-def n_infections(row, infection_place):
-    return sum([row.counts[i] for i, x in enumerate(row.location) if x == infection_place])
-
-for infection_place in all_infection_places:
-    locations_per_day[str(infection_place)] = locations_per_day.apply(
-        lambda x: n_infections(x, infection_place),
-        axis=1
-    )
-
-locations_per_day = locations_per_day.drop(columns=['location',
-                                                    'counts'])
+# one column per infection location
+locations_per_day = read.locations_per_day()
 
 locations_per_day = locations_per_day.div(
     locations_per_day.sum(axis=1), axis=0
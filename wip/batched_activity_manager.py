@@ -0,0 +1,321 @@
+from array import array
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from june.activity import ActivityManager
+from june.exc import SimulatorError
+from june.groups.leisure.leisure_tables import LeisureTablesCache
+from june.policy.policy_plan import PolicyPlans
+from june.random_streams import CounterRNG, keyed_uniforms
+
+
+class LeisureCandidates:
+    """
+    The social venue candidates of every household, per leisure activity, stored as
+    CSR arrays: the candidates of household h for an activity are
+    venues[offsets[h]:offsets[h+1]]. The arrays of an activity are built the first
+    time it is asked for.
+
+    Activities with precomputed per area candidates (see
+    june.groups.leisure.venue_candidates) use those instead, indexed by the area
+    of each person, without going through the households' social_venues.
+    """
+
+    def __init__(
+        self,
+        people: np.array,
+        areas: Optional[List["Area"]] = None,
+        area_candidates: Optional[Dict[str, "VenueCandidates"]] = None,
+    ):
+        self.area_candidates = area_candidates or {}
+        self.households = []
+        self.residence_idx = np.full(len(people), -1, dtype=np.int64)
+        residence_to_idx = {}
+        self.household_idx = np.full(len(people), -1, dtype=np.int64)
+        self.area_idx = np.full(len(people), -1, dtype=np.int64)
+        if self.area_candidates:
+            area_to_idx = {id(area): idx for idx, area in enumerate(areas)}
+        household_to_idx = {}
+        for idx, person in enumerate(people):
+            residence = person.subgroups.residence
+            if residence is None:
+                continue
+            self.residence_idx[idx] = residence_to_idx.setdefault(
+                id(residence.group), len(residence_to_idx)
+            )
+            if self.area_candidates and residence.group.spec == "household":
+                self.area_idx[idx] = area_to_idx.get(id(person.area), -1)
+            elif not hasattr(residence.group, "social_venues"):
+                continue
+            household = residence.group
+            if id(household) not in household_to_idx:
+                household_to_idx[id(household)] = len(self.households)
+                self.households.append(household)
+            self.household_idx[idx] = household_to_idx[id(household)]
+        # residents of every residence (who lives there, not who is there now)
+        housed = np.flatnonzero(self.residence_idx >= 0)
+        self.residents = housed[np.argsort(self.residence_idx[housed], kind="stable")]
+        self.residents_offsets = np.searchsorted(
+            self.residence_idx[self.residents], np.arange(len(residence_to_idx) + 1)
+        )
+        self.offsets = {}
+        self.venues = {}
+
+    def residents_of(self, person_idx: int) -> np.array:
+        """
+        Store indices of the people living in the residence of a person.
+        """
+        residence = self.residence_idx[person_idx]
+        if residence < 0:
+            return self.residents[:0]
+        return self.residents[
+            self.residents_offsets[residence] : self.residents_offsets[residence + 1]
+        ]
+
+    def _build(self, activity: str):
+        if activity in self.area_candidates:
+            candidates = self.area_candidates[activity]
+            self.offsets[activity] = candidates.offsets
+            self.venues[activity] = candidates.venue_list()
+            return
+        offsets = array("l", [0])
+        venues = []
+        for household in self.households:
+            venues.extend(getattr(household, "social_venues", {}).get(activity, ()))
+            offsets.append(len(venues))
+        self.offsets[activity] = np.frombuffer(offsets, dtype=np.int_)
+        self.venues[activity] = venues
+
+    def choose_venues(self, activity: str, people_idx: np.array, uniforms: np.array):
+        """
+        Picks uniformly one candidate venue of the given activity for each person,
+        among those of their household or area (-1 if there are no candidates).
+        """
+        if activity not in self.offsets:
+            self._build(activity)
+        if activity in self.area_candidates:
+            units = self.area_idx[people_idx]
+        else:
+            units = self.household_idx[people_idx]
+        offsets = self.offsets[activity]
+        starts = offsets[units]
+        n_candidates = np.where(units >= 0, offsets[units + 1] - starts, 0)
+        chosen = starts + np.floor(uniforms * n_candidates).astype(np.int64)
+        return np.where(n_candidates > 0, chosen, -1)
+
+
+class TrackedActivityManager(ActivityManager):
+    """
+    Activity manager that records the subgroups it places people in during a step
+    (placed_subgroups) and the subgroup of each person (placed_in, by person id), so
+    that at the end of the step only those have to be cleared instead of every
+    group of the active group types, and the groups of the infected are found
+    without searching the subgroups.
+
+    placements_complete is False if a placement could not be recorded (the person
+    was not found at the end of the subgroup of any of their activities), in which
+    case the simulator falls back to clearing every active group.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.placed_subgroups = {}
+        self.placed_in = {}
+        self.placements_complete = True
+
+    def place(self, person: "Person", subgroup: "Subgroup"):
+        subgroup.append(person)
+        self.placed_subgroups[id(subgroup)] = subgroup
+        self.placed_in[person.id] = subgroup
+
+    def clear_placements(self):
+        self.placed_subgroups = {}
+        self.placed_in = {}
+        self.placements_complete = True
+
+    def move_to_active_subgroup(self, activities: List[str], person: "Person"):
+        super().move_to_active_subgroup(activities, person)
+        for activity in activities:
+            subgroup = getattr(person.subgroups, activity, None)
+            if (
+                subgroup is not None
+                and subgroup.people
+                and subgroup.people[-1] is person
+            ):
+                self.placed_subgroups[id(subgroup)] = subgroup
+                self.placed_in[person.id] = subgroup
+                return
+        self.placements_complete = False
+
+
+class BatchedActivityManager(TrackedActivityManager):
+    """
+    Activity manager that decides leisure for the whole eligible population in
+    array operations (does the person do an activity, which activity and which of
+    their household's candidate venues). Only the leisure choice is batched: the
+    allowed activities and the activity hierarchy are still resolved, and people
+    placed, in a Python loop over the whole population, so the placement cost still
+    grows with the population.
+    """
+
+    people_store = None
+    policy_plans = None
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if self.policy_plans is None:
+            self.policy_plans = PolicyPlans(self.policies)
+        self.leisure_tables = LeisureTablesCache()
+        self.leisure_candidates = None
+        self.rng = np.random.default_rng()
+
+    def seed_step(self, seed: Optional[int], step: int, counter_based: bool = False):
+        """
+        Sets the random generator of the leisure draws of a step; counter_based
+        draws are keyed by person id instead of depending on the order of people.
+        """
+        if counter_based:
+            self.rng = CounterRNG(seed, step)
+        elif seed is None:
+            self.rng = np.random.default_rng()
+        else:
+            self.rng = np.random.default_rng([seed, step, 1])
+
+    def leisure_tables_key(self, date: datetime):
+        """
+        Key of the leisure probabilities in use: they only change with the day type,
+        the step duration and the policy period.
+        """
+        self.policy_plans.plan_for(date)
+        return (self.timer.day_type, self.timer.duration, self.policy_plans.period)
+
+    def assign_leisure(self, date: datetime, reaches_leisure: np.array):
+        """
+        Sets the leisure subgroup of everyone that does a leisure activity this step,
+        and of the housemates they drag along.
+
+        Parameters
+        ----------
+        reaches_leisure:
+            mask of the people allowed to do leisure this step (by the individual
+            policies applied to them in this step) and with no subgroup of a higher
+            activity in the hierarchy
+        """
+        people = self.world.people.people
+        store = self.people_store
+        if self.leisure_candidates is None:
+            self.leisure_candidates = LeisureCandidates(
+                people,
+                self.world.areas.members,
+                getattr(self.leisure, "venue_candidates", None),
+            )
+        candidates = self.leisure_candidates
+        tables = self.leisure_tables.get(
+            self.leisure_tables_key(date), self.leisure.probabilities_by_age_sex
+        )
+        eligible = np.flatnonzero(
+            ~store.dead
+            & reaches_leisure
+            & ((candidates.household_idx >= 0) | (candidates.area_idx >= 0))
+        )
+        uniforms = keyed_uniforms(self.rng, "leisure", store.ids[eligible], n_draws=5)
+        activities = tables.choose_with_uniforms(
+            store.sexes[eligible], store.ages[eligible], uniforms[:3]
+        )
+        max_age = tables.drags_household.shape[1] - 1
+        for activity_idx, activity in enumerate(tables.activities):
+            doers = np.flatnonzero(activities == activity_idx)
+            if len(doers) == 0:
+                continue
+            people_idx = eligible[doers]
+            venues = candidates.choose_venues(activity, people_idx, uniforms[3, doers])
+            drags_probability = tables.drags_household[
+                store.sexes[people_idx],
+                np.minimum(store.ages[people_idx], max_age),
+                activity_idx,
+            ]
+            drags = uniforms[4, doers] < drags_probability
+            for person_idx, venue_idx, drags_household in zip(people_idx, venues, drags):
+                person = people[person_idx]
+                if venue_idx < 0 or person.subgroups.leisure is not None:
+                    continue
+                subgroup = candidates.venues[activity][venue_idx].get_leisure_subgroup(
+                    person
+                )
+                person.subgroups.leisure = subgroup
+                if drags_household:
+                    for mate_idx in candidates.residents_of(person_idx):
+                        if mate_idx != person_idx and not store.dead[mate_idx]:
+                            people[mate_idx].subgroups.leisure = subgroup
+
+    def move_people_to_active_subgroups(
+        self,
+        activities: List[str],
+        date: datetime = datetime(2020, 2, 2),
+        days_from_start=0,
+    ):
+        plan = self.policy_plans.plan_for(date)
+        activities = self.apply_activity_hierarchy(activities)
+        people = self.world.people.people
+        codes = plan.codes(activities, len(people))
+        dynamic = plan.dynamic_mask(self.people_store)
+        # the subgroup of the highest allowed activity of everyone, or the activities
+        # left from leisure down for the people that get that far in the hierarchy
+        placements = []
+        reaches_leisure = np.zeros(len(people), dtype=bool)
+        for person_idx, person in enumerate(people):
+            if person.dead or person.busy:
+                continue
+            allowed_activities = plan.allowed_activities(
+                codes,
+                person_idx,
+                person,
+                activities,
+                days_from_start,
+                dynamic[person_idx],
+            )
+            subgroup = self.first_subgroup(allowed_activities, person)
+            if subgroup is None:
+                reaches_leisure[person_idx] = True
+                allowed_activities = allowed_activities[
+                    allowed_activities.index("leisure") :
+                ]
+            placements.append((person, subgroup, allowed_activities))
+        if "leisure" in activities and self.leisure is not None:
+            self.assign_leisure(date, reaches_leisure)
+        for person, subgroup, allowed_activities in placements:
+            if subgroup is None:
+                self.move_to_active_subgroup(allowed_activities, person)
+            else:
+                self.place(person, subgroup)
+
+    def first_subgroup(self, activities: List[str], person: "Person"):
+        """
+        Subgroup of the first of the (hierarchy sorted) activities the person has a
+        subgroup for, None if leisure is reached before.
+        """
+        for activity in activities:
+            if activity == "leisure":
+                return None
+            subgroup = self.get_personal_subgroup(person=person, activity=activity)
+            if subgroup is not None:
+                return subgroup
+        raise SimulatorError(
+            "Attention! Some people do not have an activity in this timestep."
+        )
+
+    def move_to_active_subgroup(self, activities: List[str], person: "Person"):
+        for activity in activities:
+            if activity == "leisure":
+                # decided in bulk by assign_leisure, None if no leisure this step
+                subgroup = person.subgroups.leisure
+            else:
+                subgroup = self.get_personal_subgroup(person=person, activity=activity)
+            if subgroup is not None:
+                self.place(person, subgroup)
+                return
+        raise SimulatorError(
+            "Attention! Some people do not have an activity in this timestep."
+        )
@@ -0,0 +1,189 @@
+import gc
+import json
+import logging
+import random
+import time
+from multiprocessing import get_context
+from pathlib import Path
+from typing import List
+
+import h5py
+import numpy as np
+
+from june.groups.leisure.venue_candidates import prepare_venue_candidates
+from june.infection_seed import InfectionSeed
+from june.interaction import Interaction
+from june.simulator import Simulator, default_config_filename
+from june.world import World
+
+logger = logging.getLogger(__name__)
+
+# set in the parent right before forking, so that every worker inherits the prepared
+# world copy-on-write instead of receiving it pickled
+_ensemble = None
+
+
+def _run_scenario(idx: int, scenario: dict) -> tuple:
+    """
+    Worker side of the ensemble: applies the scenario parameters to the inherited
+    interaction, seeds the infection and runs a simulator saving to its own
+    directory.
+
+    Returns
+    -------
+    the scenario index, its results file and the run time in seconds.
+    """
+    start = time.perf_counter()
+    ensemble = _ensemble
+    seed = scenario["seed"]
+    np.random.seed(seed)
+    random.seed(seed)
+    interaction = ensemble.interaction
+    interaction.beta.update(scenario.get("beta", {}))
+    if "alpha_physical" in scenario:
+        interaction.alpha_physical = scenario["alpha_physical"]
+    infection_seed = InfectionSeed(
+        ensemble.world.super_areas, ensemble.infection_selector
+    )
+    infection_seed.unleash_virus(scenario.get("n_cases", ensemble.n_cases))
+    save_path = ensemble.run_path(idx)
+    simulator = Simulator.from_file(
+        ensemble.world,
+        interaction,
+        ensemble.infection_selector,
+        policies=ensemble.policies,
+        leisure=ensemble.leisure,
+        config_filename=ensemble.config_filename,
+        save_path=str(save_path),
+        seed=seed,
+        batched_activities=ensemble.batched_activities,
+        async_writer=True,
+    )
+    simulator.run()
+    return idx, str(save_path / "results.h5"), time.perf_counter() - start
+
+
+class EnsembleRunner:
+    """
+    Runs many scenarios (beta, alpha_physical, number of cases and seed) on the same
+    world. The world, interaction, leisure and policies are prepared once in this
+    process; every scenario runs in a process forked from it, which shares the
+    prepared world copy-on-write and modifies only its own copy.
+
+    Scenarios are handed out one at a time to a pool of n_processes workers (each
+    worker runs one scenario and is replaced by a fresh fork), so all cores stay
+    busy whatever the run time of each scenario. Once the pool has been shut down,
+    the results of every run are copied into one combined store,
+    save_path/ensemble.h5, with one group per run holding its parameters as
+    attributes. No HDF5 file is open in this process while workers are being forked,
+    since a child forked while the HDF5 library holds its lock would deadlock.
+    """
+
+    def __init__(
+        self,
+        world: World,
+        interaction: Interaction,
+        infection_selector,
+        leisure=None,
+        policies=None,
+        config_filename: str = default_config_filename,
+        save_path: str = "ensemble",
+        n_cases: int = 50,
+        batched_activities: bool = False,
+    ):
+        self.world = world
+        self.interaction = interaction
+        self.infection_selector = infection_selector
+        self.leisure = leisure
+        self.policies = policies
+        self.config_filename = config_filename
+        self.save_path = Path(save_path)
+        self.n_cases = n_cases
+        self.batched_activities = batched_activities
+
+    def run_path(self, idx: int) -> Path:
+        return self.save_path / f"run_{idx:04d}"
+
+    def prepare(self):
+        """
+        Loads everything the workers would otherwise load on their own (lazily
+        loaded group types and the leisure venue candidates), and moves the prepared objects out of the garbage
+        collector's reach so that collections in the workers do not copy their pages.
+        """
+        if hasattr(self.world, "materialize_all"):
+            self.world.materialize_all()
+        if self.leisure is not None:
+            prepare_venue_candidates(
+                self.leisure,
+                self.world,
+                assign_households=not self.batched_activities,
+            )
+        gc.collect()
+        gc.freeze()
+
+    def run(
+        self, scenarios: List[dict], n_processes: int, seed: int = 0
+    ) -> Path:
+        """
+        Runs every scenario and returns the path of the combined results store.
+
+        Parameters
+        ----------
+        scenarios:
+            one dict per run with any of "beta" (dict of betas to update),
+            "alpha_physical", "n_cases" and "seed" (seed + run index by default)
+        n_processes:
+            number of runs at the same time
+        """
+        global _ensemble
+        scenarios = [dict(scenario) for scenario in scenarios]
+        for idx, scenario in enumerate(scenarios):
+            scenario.setdefault("seed", seed + idx)
+        self.save_path.mkdir(parents=True, exist_ok=True)
+        combined_path = self.save_path / "ensemble.h5"
+        self.prepare()
+        _ensemble = self
+        start = time.perf_counter()
+        runs = []
+        try:
+            with get_context("fork").Pool(n_processes, maxtasksperchild=1) as pool:
+                for idx, results_path, run_time in pool.imap_unordered(
+                    _run_star, list(enumerate(scenarios)), chunksize=1
+                ):
+                    runs.append((idx, results_path, run_time))
+                    elapsed = time.perf_counter() - start
+                    logger.info(
+                        f"Run {idx} done in {run_time:.0f} s "
+                        f"({len(runs)}/{len(scenarios)}, "
+                        f"{3600 * len(runs) / elapsed:.1f} scenarios per hour)"
+                    )
+                pool.close()
+                pool.join()
+        finally:
+            _ensemble = None
+            gc.unfreeze()
+        with h5py.File(combined_path, "w") as combined:
+            for idx, results_path, run_time in sorted(runs):
+                self._combine(combined, idx, scenarios[idx], results_path, run_time)
+        return combined_path
+
+    @staticmethod
+    def _combine(
+        combined: h5py.File,
+        idx: int,
+        scenario: dict,
+        results_path: str,
+        run_time: float,
+    ):
+        group = combined.create_group(f"run_{idx:04d}")
+        group.attrs["parameters"] = json.dumps(scenario)
+        group.attrs["run_time"] = run_time
+        if Path(results_path).exists():
+            with h5py.File(results_path, "r") as results:
+                for name in results:
+                    results.copy(results[name], group)
+        combined.flush()
+
+
+def _run_star(arguments: tuple) -> tuple:
+    return _run_scenario(*arguments)
@@ -0,0 +1,198 @@
+import os
+from pathlib import Path
+from tempfile import NamedTemporaryFile
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from june import paths
+from june.demography.geography import (
+    Area,
+    Areas,
+    Geography,
+    SuperArea,
+    SuperAreas,
+    default_hierarchy_filename,
+    default_area_coord_filename,
+    default_superarea_coord_filename,
+)
+
+default_cache_filename = paths.data_path / "input/geography/geography_cache.npz"
+
+
+def savez_atomic(filename: str, **arrays):
+    """
+    np.savez to a temporary file next to filename, then renamed over it, so that
+    concurrent jobs never read a partially written cache.
+    """
+    filename = Path(filename)
+    with NamedTemporaryFile(
+        dir=filename.parent, prefix=f".{filename.stem}.", suffix=".npz", delete=False
+    ) as f:
+        try:
+            np.savez(f, **arrays)
+        except BaseException:
+            os.unlink(f.name)
+            raise
+    os.replace(f.name, filename)
+
+
+class GeographyCache:
+    """
+    Compiled copy of the geography CSV files (hierarchy, area and super area
+    coordinates), with the rows of every table sorted by super area and an index
+    of the row range of each super area, so that the tables of a few super areas
+    are sliced out instead of parsing and filtering the full CSV files.
+
+    The cache is compiled on first use and rebuilt if any CSV file is newer.
+    """
+
+    def __init__(self, arrays: Dict[str, np.array]):
+        self.arrays = arrays
+
+    @classmethod
+    def compile(
+        cls,
+        cache_filename: str = default_cache_filename,
+        hierarchy_filename: str = default_hierarchy_filename,
+        area_coord_filename: str = default_area_coord_filename,
+        superarea_coord_filename: str = default_superarea_coord_filename,
+    ) -> "GeographyCache":
+        hierarchy = pd.read_csv(hierarchy_filename)
+        area_to_super_area = hierarchy.set_index("area")["super_area"]
+        tables = {
+            "hierarchy": hierarchy,
+            "area_coordinates": pd.read_csv(area_coord_filename),
+            "super_area_coordinates": pd.read_csv(superarea_coord_filename),
+        }
+        arrays = {}
+        for table_name, table in tables.items():
+            if "super_area" in table.columns:
+                keys = table["super_area"]
+            else:
+                keys = table["area"].map(area_to_super_area)
+            keys = keys.values.astype(str)
+            order = np.argsort(keys, kind="stable")
+            super_areas, starts = np.unique(keys[order], return_index=True)
+            arrays[f"{table_name}__super_areas"] = super_areas
+            arrays[f"{table_name}__starts"] = np.append(starts, len(keys))
+            arrays[f"{table_name}__columns"] = np.array(table.columns, dtype=str)
+            for column in table.columns:
+                values = table[column].values[order]
+                if values.dtype == object:
+                    values = values.astype(str)
+                arrays[f"{table_name}__{column}"] = values
+        savez_atomic(cache_filename, **arrays)
+        return cls(arrays)
+
+    @classmethod
+    def from_file(
+        cls,
+        cache_filename: str = default_cache_filename,
+        hierarchy_filename: str = default_hierarchy_filename,
+        area_coord_filename: str = default_area_coord_filename,
+        superarea_coord_filename: str = default_superarea_coord_filename,
+    ) -> "GeographyCache":
+        """
+        Loads the compiled geography, compiling it first if it does not exist or is
+        older than any of the CSV files.
+        """
+        cache_filename = Path(cache_filename)
+        sources = (hierarchy_filename, area_coord_filename, superarea_coord_filename)
+        if not cache_filename.exists() or any(
+            Path(source).stat().st_mtime > cache_filename.stat().st_mtime
+            for source in sources
+        ):
+            return cls.compile(cache_filename, *sources)
+        with np.load(cache_filename) as cache:
+            return cls({name: cache[name] for name in cache.files})
+
+    def super_areas_for(self, filter_key: Optional[Dict[str, list]]) -> np.array:
+        """
+        Names of the super areas selected by a Geography.from_file filter key
+        ("super_area" or "region"), all of them if filter_key is None.
+        """
+        if filter_key is None:
+            return self.arrays["hierarchy__super_areas"]
+        if "super_area" in filter_key:
+            return np.unique(np.array(filter_key["super_area"], dtype=str))
+        if "region" in filter_key:
+            regions = self.arrays["hierarchy__region"]
+            super_areas = self.arrays["hierarchy__super_area"]
+            return np.unique(super_areas[np.isin(regions, filter_key["region"])])
+        raise ValueError(f"Cannot select super areas with filter key {filter_key}")
+
+    def columns(self, table_name: str, super_areas: List[str]) -> Dict[str, np.array]:
+        """
+        Columns of the rows of a table belonging to the given super areas.
+        """
+        names = self.arrays[f"{table_name}__super_areas"]
+        starts = self.arrays[f"{table_name}__starts"]
+        super_areas = np.asarray(super_areas, dtype=str)
+        positions = np.searchsorted(names, super_areas)
+        found = positions < len(names)
+        found[found] = names[positions[found]] == super_areas[found]
+        rows = np.concatenate(
+            [np.arange(starts[p], starts[p + 1]) for p in positions[found]]
+            + [np.zeros(0, dtype=np.int64)]
+        )
+        return {
+            column: self.arrays[f"{table_name}__{column}"][rows]
+            for column in self.arrays[f"{table_name}__columns"]
+        }
+
+    def select(self, table_name: str, super_areas: List[str]) -> pd.DataFrame:
+        """
+        Rows of a table belonging to the given super areas.
+        """
+        return pd.DataFrame(self.columns(table_name, super_areas))
+
+    def geography(self, filter_key: Optional[Dict[str, list]] = None) -> Geography:
+        """
+        Geography of the super areas selected by filter_key, built straight from the
+        sliced arrays (as Geography.create_geographical_units does from the CSV
+        files).
+        """
+        super_areas = self.super_areas_for(filter_key)
+        hierarchy = self.columns("hierarchy", super_areas)
+        area_coordinates = self.columns("area_coordinates", super_areas)
+        super_area_coordinates = self.columns("super_area_coordinates", super_areas)
+        area_to_coordinates = dict(
+            zip(
+                area_coordinates["area"].tolist(),
+                np.column_stack(
+                    [area_coordinates["latitude"], area_coordinates["longitude"]]
+                ),
+            )
+        )
+        areas_of = {}
+        for area_name, super_area_name in zip(
+            hierarchy["area"].tolist(), hierarchy["super_area"].tolist()
+        ):
+            areas_of.setdefault(super_area_name, []).append(area_name)
+        areas, super_area_list = [], []
+        for super_area_name, latitude, longitude in zip(
+            super_area_coordinates["super_area"].tolist(),
+            super_area_coordinates["latitude"],
+            super_area_coordinates["longitude"],
+        ):
+            if super_area_name not in areas_of:
+                continue
+            super_area = SuperArea(
+                name=super_area_name,
+                areas=None,
+                coordinates=np.array([latitude, longitude]),
+            )
+            super_area.areas = [
+                Area(
+                    name=area_name,
+                    super_area=super_area,
+                    coordinates=area_to_coordinates[area_name],
+                )
+                for area_name in areas_of.pop(super_area_name)
+                if area_name in area_to_coordinates
+            ]
+            areas.extend(super_area.areas)
+            super_area_list.append(super_area)
+        return Geography(Areas(areas), SuperAreas(super_area_list))
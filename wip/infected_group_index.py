@@ -0,0 +1,65 @@
+from typing import Dict, List, Optional
+
+from june.demography import Person
+
+
+class InfectedGroupIndex:
+    """
+    Live index from the currently infectious people to the groups they sit in
+    during the current time step, so that only groups containing an infector
+    need to be time stepped.
+
+    The infected set is updated when people get infected, recover or die, and the
+    groups are re-indexed every time the activity manager places people.
+    """
+
+    def __init__(self):
+        self.infected: Dict[int, Person] = {}
+        self.groups: Dict[str, dict] = {}
+
+    def __len__(self):
+        return len(self.infected)
+
+    def add_infected(self, person: Person):
+        self.infected[person.id] = person
+
+    def remove_infected(self, person: Person):
+        self.infected.pop(person.id, None)
+
+    def place_infected(
+        self, activities: List[str], placed_in: Optional[Dict[int, "Subgroup"]] = None
+    ):
+        """
+        Indexes the group each infected person was placed in by the activity manager.
+
+        Parameters
+        ----------
+        activities:
+            active activities of the current step, sorted by the activity hierarchy
+        placed_in:
+            subgroup each person was placed in, by person id, as recorded by a
+            TrackedActivityManager. Without it, the subgroups of every activity of
+            each infected person are searched for them.
+        """
+        self.groups = {}
+        if placed_in is not None:
+            for person_id in self.infected:
+                subgroup = placed_in.get(person_id)
+                if subgroup is not None:
+                    group = subgroup.group
+                    self.groups.setdefault(group.spec, {})[id(group)] = group
+            return
+        for person in self.infected.values():
+            for activity in activities:
+                subgroup = getattr(person.subgroups, activity, None)
+                if subgroup is None or person not in subgroup.people:
+                    continue
+                group = subgroup.group
+                self.groups.setdefault(group.spec, {})[id(group)] = group
+                break
+
+    def groups_for_spec(self, spec: str) -> List["Group"]:
+        return list(self.groups.get(spec, {}).values())
+
+    def clear_placements(self):
+        self.groups = {}
@@ -9,6 +9,7 @@ from multiprocessing import get_context
 from multiprocessing import Pool, Process
 from june import paths
 from june.interaction.interactive_group import InteractiveGroup
+from june.random_streams import CounterRNG
 from itertools import chain
 
 default_config_filename = (
@@ -79,6 +80,112 @@ def infect_susceptibles(effective_transmission_probability, susceptible_ids):
     return infected_ids
 
 
+@nb.jit(nopython=True)
+def compute_effective_transmission_batch(
+    susceptible_group_idx: np.array,
+    susceptible_subgroups: np.array,
+    infector_offsets: np.array,
+    infector_subgroups: np.array,
+    infector_subgroup_sizes: np.array,
+    transmission_probabilities: np.array,
+    transmission_tensor: np.array,
+    group_layouts: np.array,
+):
+    """
+    Computes the effective transmission probability of every susceptible subgroup
+    of a batch of groups of the same type in one go.
+
+    Parameters
+    ----------
+    - susceptible_group_idx : batch index of the group each susceptible subgroup belongs to.
+    - susceptible_subgroups : subgroup index of each susceptible subgroup.
+    - infector_offsets : for group g, its infector subgroups are in
+      [infector_offsets[g], infector_offsets[g+1]).
+    - infector_subgroups : subgroup index of each infector subgroup.
+    - infector_subgroup_sizes : size of each infector subgroup.
+    - transmission_probabilities : summed transmission probability of each infector subgroup.
+    - transmission_tensor : stacked beta * delta_time * contact matrices, indexed by
+      subgroup index (one per school years layout for schools, a single one otherwise).
+    - group_layouts : index in transmission_tensor of the matrix of each group.
+    """
+    n_susceptible_subgroups = len(susceptible_group_idx)
+    effective_probabilities = np.empty(n_susceptible_subgroups)
+    for k in range(n_susceptible_subgroups):
+        group_idx = susceptible_group_idx[k]
+        susceptibles_idx = susceptible_subgroups[k]
+        contacts = transmission_tensor[group_layouts[group_idx], susceptibles_idx]
+        transmission_exponent = 0.0
+        for j in range(infector_offsets[group_idx], infector_offsets[group_idx + 1]):
+            infecters_idx = infector_subgroups[j]
+            subgroup_size = infector_subgroup_sizes[j]
+            if susceptibles_idx == infecters_idx:
+                subgroup_size -= 1
+                if subgroup_size == 0:
+                    continue
+            transmission_exponent += (
+                contacts[infecters_idx] / subgroup_size * transmission_probabilities[j]
+            )
+        effective_probabilities[k] = 1.0 - np.exp(-transmission_exponent)
+    return effective_probabilities
+
+
+def infect_susceptibles_batch(
+    effective_transmission_probabilities, susceptible_offsets, susceptible_ids, rng
+):
+    """
+    Draws the infection of every susceptible person of a batch at once,
+    one uniform per susceptible. Returns a boolean mask over susceptible_ids.
+    """
+    susceptibles_per_subgroup = np.diff(susceptible_offsets)
+    probabilities = np.repeat(
+        effective_transmission_probabilities, susceptibles_per_subgroup
+    )
+    return rng.random(len(susceptible_ids)) < probabilities
+
+
+def infect_susceptibles_binomial(
+    effective_transmission_probabilities, susceptible_offsets, susceptible_ids, rng
+):
+    """
+    Draws the number of new infections of every susceptible subgroup of a batch
+    from a binomial, and then picks that many ids without replacement from the
+    subgroup. Returns a boolean mask over susceptible_ids.
+    """
+    susceptibles_per_subgroup = np.diff(susceptible_offsets)
+    n_infected = rng.binomial(
+        susceptibles_per_subgroup, effective_transmission_probabilities
+    )
+    infected_mask = np.zeros(len(susceptible_ids), dtype=bool)
+    for k in np.flatnonzero(n_infected):
+        infected_idx = rng.choice(
+            susceptibles_per_subgroup[k], n_infected[k], replace=False
+        )
+        infected_mask[susceptible_offsets[k] + infected_idx] = True
+    return infected_mask
+
+
+def infect_susceptibles_counter(
+    effective_transmission_probabilities, susceptible_offsets, susceptible_ids, rng
+):
+    """
+    Draws the infection of every susceptible person of a batch from a uniform keyed
+    by (seed, step, person id) of the CounterRNG rng, so that the draws do not
+    depend on how the groups are batched or split over processes.
+    Returns a boolean mask over susceptible_ids.
+    """
+    probabilities = np.repeat(
+        effective_transmission_probabilities, np.diff(susceptible_offsets)
+    )
+    return rng.bernoulli("infection", susceptible_ids, probabilities)
+
+
+infection_samplers = {
+    "bernoulli": infect_susceptibles_batch,
+    "binomial": infect_susceptibles_binomial,
+    "counter": infect_susceptibles_counter,
+}
+
+
 @nb.jit(nopython=True)
 def _get_contacts_in_school(
     contact_matrix, school_years, susceptibles_idx, infecters_idx
@@ -120,13 +227,210 @@ def _translate_school_subgroup(idx, school_years):
     return idx
 
 
+def translate_school_contact_matrix(contact_matrix, school_years):
+    """
+    Contact matrix of a school indexed by its own subgroups (0 for teachers, then
+    one per school year), that is, _get_contacts_in_school for every pair of
+    subgroups.
+    """
+    subgroups = np.concatenate(([0], np.asarray(school_years, dtype=np.int_) + 1))
+    translated = contact_matrix[np.ix_(subgroups, subgroups)]
+    translated[0, 1:] /= len(school_years)
+    return translated
+
+
+class InteractiveGroupBatch:
+    """
+    Structure-of-arrays view of all the interactive groups of a group type
+    (households, companies, schools, pubs...) that must be time stepped.
+    """
+
+    def __init__(self, interactive_groups: List[InteractiveGroup]):
+        self.interactive_groups = interactive_groups
+        self.spec = interactive_groups[0].spec
+        self.n_groups = len(interactive_groups)
+        self.is_school = interactive_groups[0].school_years is not None
+        self.school_layouts = []
+        layout_idx = {}
+        group_layouts = array("l", [])
+        susceptible_group_idx = array("l", [])
+        susceptible_subgroups = array("l", [])
+        susceptible_offsets = array("l", [0])
+        susceptible_ids = array("l", [])
+        infector_offsets = array("l", [0])
+        infector_subgroups = array("l", [])
+        infector_subgroup_sizes = array("l", [])
+        transmission_probabilities = array("d", [])
+        infector_ids = array("l", [])
+        infector_ids_offsets = array("l", [0])
+        for group_idx, group in enumerate(interactive_groups):
+            for subgroup_idx, ids in zip(
+                group.subgroups_susceptible, group.susceptible_ids
+            ):
+                susceptible_group_idx.append(group_idx)
+                susceptible_subgroups.append(subgroup_idx)
+                susceptible_ids.extend(ids)
+                susceptible_offsets.append(len(susceptible_ids))
+            infector_subgroups.extend(group.subgroups_infector)
+            infector_subgroup_sizes.extend(group.infector_subgroup_sizes)
+            transmission_probabilities.extend(group.transmission_probabilities)
+            infector_offsets.append(len(infector_subgroups))
+            for ids in group.infector_ids:
+                infector_ids.extend(ids)
+            infector_ids_offsets.append(len(infector_ids))
+            if self.is_school:
+                layout = tuple(group.school_years)
+                if layout not in layout_idx:
+                    layout_idx[layout] = len(self.school_layouts)
+                    self.school_layouts.append(layout)
+                group_layouts.append(layout_idx[layout])
+            else:
+                group_layouts.append(0)
+        self.susceptible_group_idx = np.frombuffer(susceptible_group_idx, dtype=np.int_)
+        self.susceptible_subgroups = np.frombuffer(susceptible_subgroups, dtype=np.int_)
+        self.susceptible_offsets = np.frombuffer(susceptible_offsets, dtype=np.int_)
+        self.susceptible_ids = np.frombuffer(susceptible_ids, dtype=np.int_)
+        self.infector_offsets = np.frombuffer(infector_offsets, dtype=np.int_)
+        self.infector_subgroups = np.frombuffer(infector_subgroups, dtype=np.int_)
+        self.infector_subgroup_sizes = np.frombuffer(
+            infector_subgroup_sizes, dtype=np.int_
+        )
+        self.transmission_probabilities = np.frombuffer(
+            transmission_probabilities, dtype=np.float64
+        )
+        self.infector_ids = np.frombuffer(infector_ids, dtype=np.int_)
+        self.infector_ids_offsets = np.frombuffer(infector_ids_offsets, dtype=np.int_)
+        self.group_layouts = np.frombuffer(group_layouts, dtype=np.int_)
+
+    def infected_per_group(self, infected_mask: np.array) -> np.array:
+        """
+        Number of people infected in each group of the batch, given the
+        infection mask over susceptible_ids.
+        """
+        group_of_susceptible = np.repeat(
+            self.susceptible_group_idx, np.diff(self.susceptible_offsets)
+        )
+        return np.bincount(
+            group_of_susceptible[infected_mask], minlength=self.n_groups
+        )
+
+    def blame(self, n_infected_per_group: np.array, infector_probabilities: np.array):
+        """
+        Splits the infections of each group among its infectors, proportionally to
+        their transmission probability.
+
+        Parameters
+        ----------
+        n_infected_per_group:
+            number of people infected in each group of the batch
+        infector_probabilities:
+            transmission probability of each of the batch infector_ids
+
+        Returns
+        -------
+        the secondary infections to add to each of the batch infector_ids
+        """
+        group_transmission = np.add.reduceat(
+            self.transmission_probabilities, self.infector_offsets[:-1]
+        )
+        group_of_infector = np.repeat(
+            np.arange(self.n_groups), np.diff(self.infector_ids_offsets)
+        )
+        n_infected = n_infected_per_group[group_of_infector]
+        blame = n_infected * infector_probabilities
+        # groups that infected nobody may have only zero probability infectors
+        return np.divide(
+            blame,
+            group_transmission[group_of_infector],
+            out=np.zeros_like(blame, dtype=np.float64),
+            where=n_infected > 0,
+        )
+
+
+class BetaDict(dict):
+    """
+    Betas per group spec that count their modifications, so that Interaction can
+    tell when the precombined transmission tensors are out of date.
+    """
+
+    # class default, so that unpickling (which sets the items before the instance
+    # attributes) can already count modifications
+    version = 0
+
+    def _modified(method):
+        def wrapper(self, *args, **kwargs):
+            result = method(self, *args, **kwargs)
+            self.version += 1
+            return result
+
+        return wrapper
+
+    def __setitem__(self, key, value):
+        # policies re-assign the betas every step, usually to the same values
+        if key in self and self[key] == value:
+            return
+        super().__setitem__(key, value)
+        self.version += 1
+
+    __delitem__ = _modified(dict.__delitem__)
+    update = _modified(dict.update)
+    pop = _modified(dict.pop)
+    popitem = _modified(dict.popitem)
+    setdefault = _modified(dict.setdefault)
+    clear = _modified(dict.clear)
+    del _modified
+
+
 class Interaction:
-    def __init__(self, alpha_physical, beta, contact_matrices):
-        self.alpha_physical = alpha_physical
+    def __init__(self, alpha_physical, beta, contact_matrices, sampling="binomial"):
+        """
+        Parameters
+        ----------
+        sampling:
+            how infections are drawn in the batched engine: "bernoulli" draws one
+            uniform per susceptible, "binomial" draws the number of infections per
+            subgroup and then picks the infected ids, "counter" draws one uniform per
+            susceptible keyed by (seed, step, person id), identical in serial and
+            parallel runs.
+        """
+        if sampling not in infection_samplers:
+            raise ValueError(
+                f"Unknown sampling {sampling}, choose from {list(infection_samplers)}"
+            )
         self.beta = beta
+        self.input_contact_matrices = contact_matrices
+        self.school_layouts = {}
+        self.alpha_physical = alpha_physical
+        self.sampling = sampling
+        self.rng = np.random.default_rng()
+
+    @property
+    def beta(self) -> BetaDict:
+        return self._beta
+
+    @beta.setter
+    def beta(self, beta: dict):
+        self._beta = BetaDict(beta)
+        self.transmission_tensors = {}
+
+    @property
+    def alpha_physical(self) -> float:
+        return self._alpha_physical
+
+    @alpha_physical.setter
+    def alpha_physical(self, alpha_physical: float):
+        """
+        Setting a different alpha_physical re-processes the contact matrices and
+        drops every matrix derived from them.
+        """
+        if alpha_physical == getattr(self, "_alpha_physical", None):
+            return
+        self._alpha_physical = alpha_physical
         self.contact_matrices = self.process_contact_matrices(
-            groups=beta.keys(), input_contact_matrices=contact_matrices
+            groups=self.beta.keys(), input_contact_matrices=self.input_contact_matrices
         )
+        self.school_contact_matrices = {}
+        self.transmission_tensors = {}
 
     @classmethod
     def from_file(
@@ -139,8 +443,21 @@ class Interaction:
             alpha_physical=config["alpha_physical"],
             beta=config["beta"],
             contact_matrices=contact_matrices,
+            sampling=config.get("sampling", "binomial"),
         )
 
+    def seed_step(self, seed: int, step: int):
+        """
+        Sets the random generator used to draw the infections of a time step.
+        Seeding it with (seed, step) makes every step reproducible on its own.
+        """
+        if self.sampling == "counter":
+            self.rng = CounterRNG(seed, step)
+        elif seed is None:
+            self.rng = np.random.default_rng()
+        else:
+            self.rng = np.random.default_rng([seed, step])
+
     def process_contact_matrices(self, groups: List[str], input_contact_matrices: dict):
         contact_matrices = {}
         default_contacts = np.array([[1]])
@@ -213,10 +530,79 @@ class Interaction:
             )
         return contact_matrix
 
+    def school_contact_matrix(self, school_years) -> np.array:
+        """
+        Translated and normalized contact matrix of the schools with the given
+        school years, computed once per distinct layout.
+        """
+        layout = tuple(school_years)
+        contact_matrix = self.school_contact_matrices.get(layout)
+        if contact_matrix is None:
+            contact_matrix = translate_school_contact_matrix(
+                self.contact_matrices["school"], layout
+            )
+            self.school_contact_matrices[layout] = contact_matrix
+        return contact_matrix
+
+    def school_layout_index(self, school_years) -> int:
+        """
+        Index of a school years layout in the school transmission tensors,
+        registering it (and dropping the school tensors) if it is new.
+        """
+        layout = tuple(school_years)
+        idx = self.school_layouts.get(layout)
+        if idx is None:
+            idx = self.school_layouts[layout] = len(self.school_layouts)
+            for key in [key for key in self.transmission_tensors if key[0] == "school"]:
+                del self.transmission_tensors[key]
+        return idx
+
+    def transmission_tensor(self, spec: str, delta_time: float) -> np.array:
+        """
+        beta * delta_time * contact matrix of a group spec, with shape (1, n, n), or
+        for schools one (zero padded) matrix per registered school years layout.
+        Tensors are kept per spec and duration and only rebuilt after beta,
+        alpha_physical or the school layouts change.
+        """
+        key = (spec, delta_time)
+        cached = self.transmission_tensors.get(key)
+        if cached is not None and cached[0] == self.beta.version:
+            return cached[1]
+        factor = self.beta[spec] * delta_time
+        if spec == "school":
+            size = len(self.contact_matrices[spec])
+            tensor = np.zeros((max(len(self.school_layouts), 1), size, size))
+            for layout, idx in self.school_layouts.items():
+                matrix = self.school_contact_matrix(layout)
+                tensor[idx, : len(matrix), : len(matrix)] = factor * matrix
+        else:
+            tensor = factor * self.contact_matrices[spec][np.newaxis]
+        self.transmission_tensors[key] = (self.beta.version, tensor)
+        return tensor
+
+    def batch_transmission(self, batch: InteractiveGroupBatch, delta_time: float):
+        """
+        Transmission tensor of a batch and the index in it of every group's matrix.
+        """
+        if not batch.is_school:
+            return self.transmission_tensor(batch.spec, delta_time), batch.group_layouts
+        layouts = np.array(
+            [self.school_layout_index(layout) for layout in batch.school_layouts],
+            dtype=np.int_,
+        )
+        return (
+            self.transmission_tensor(batch.spec, delta_time),
+            layouts[batch.group_layouts],
+        )
+
     def time_step_for_group(self, delta_time: float, group: InteractiveGroup):
-        contact_matrix = self.contact_matrices[group.spec]
-        beta = self.beta[group.spec]
-        school_years = group.school_years
+        layout = 0
+        if group.school_years is not None:
+            layout = self.school_layout_index(group.school_years)
+        contact_matrix = self.transmission_tensor(group.spec, delta_time)[layout]
+        # beta and delta_time are already in the transmission tensor
+        beta, delta_time = 1.0, 1.0
+        school_years = None
         infected_ids = array('l', [])
         if len(group.subgroups_susceptible) == 1:
             infected_ids = self.time_step_for_subgroup(
@@ -248,6 +634,39 @@ class Interaction:
                     infected_ids += ids
         return infected_ids
 
+    def time_step_for_group_type(
+        self, delta_time: float, batch: InteractiveGroupBatch
+    ):
+        """
+        Time steps all the groups of a batch with a couple of vectorized calls.
+
+        Returns
+        -------
+        the ids of the newly infected people and the number of infections in
+        each group of the batch.
+        """
+        transmission_tensor, group_layouts = self.batch_transmission(batch, delta_time)
+        effective_transmission_probabilities = compute_effective_transmission_batch(
+            susceptible_group_idx=batch.susceptible_group_idx,
+            susceptible_subgroups=batch.susceptible_subgroups,
+            infector_offsets=batch.infector_offsets,
+            infector_subgroups=batch.infector_subgroups,
+            infector_subgroup_sizes=batch.infector_subgroup_sizes,
+            transmission_probabilities=batch.transmission_probabilities,
+            transmission_tensor=transmission_tensor,
+            group_layouts=group_layouts,
+        )
+        infected_mask = infection_samplers[self.sampling](
+            effective_transmission_probabilities,
+            batch.susceptible_offsets,
+            batch.susceptible_ids,
+            self.rng,
+        )
+        return (
+            batch.susceptible_ids[infected_mask],
+            batch.infected_per_group(infected_mask),
+        )
+
     def time_step_for_subgroup(
         self,
         subgroup_transmission_probabilities,
@@ -270,6 +689,12 @@ class Interaction:
             delta_time=delta_time,
             school_years=school_years,
         )
+        if isinstance(self.rng, CounterRNG):
+            susceptible_ids = np.asarray(susceptible_ids, dtype=np.int_)
+            infected = self.rng.bernoulli(
+                "infection", susceptible_ids, effective_transmission_probability
+            )
+            return array("l", susceptible_ids[infected])
         infected_ids = infect_susceptibles(
             effective_transmission_probability, susceptible_ids
         )
@@ -0,0 +1,218 @@
+from typing import Optional
+
+import h5py
+import numpy as np
+
+from june.demography import Activities, Person, Population
+from june.groups import Cemeteries, CommuteCityUnits, CommuteUnits
+from june.hdf5_savers import (
+    load_commute_cities_from_hdf5,
+    load_commute_hubs_from_hdf5,
+    load_geography_from_hdf5,
+    load_households_from_hdf5,
+    load_care_homes_from_hdf5,
+    load_schools_from_hdf5,
+    load_companies_from_hdf5,
+    load_hospitals_from_hdf5,
+    load_universities_from_hdf5,
+)
+from june.world import World
+
+# integer used by save_population_to_hdf5 for missing values
+nan_integer = -999
+
+
+def mmap_dataset(dataset: h5py.Dataset) -> np.array:
+    """
+    Memory-maps a contiguous, uncompressed dataset straight from the HDF5 file.
+    Chunked or compressed datasets cannot be mapped and are read into memory.
+    """
+    offset = dataset.id.get_offset()
+    if dataset.chunks is not None or offset is None:
+        return dataset[()]
+    return np.memmap(
+        dataset.file.filename,
+        dtype=dataset.dtype,
+        mode="r",
+        offset=offset,
+        shape=dataset.shape,
+    )
+
+
+class LazyWorld(World):
+    """
+    World loaded from the HDF5 file written by World.to_hdf5, in which only the
+    geography and the people are built up front. Each group type is loaded, and
+    its members linked to their subgroups, the first time it is accessed
+    (e.g. world.schools).
+
+    The population and group membership datasets are read through one file handle
+    (world.file) and memory-mapped when stored contiguously. The geography, the
+    commute and the group types go through the june.hdf5_savers loaders, which take
+    a path and open the file themselves. The geography is loaded once and kept as
+    world.geography; commute hubs, cities and their units are loaded with the
+    people, as in generate_world_from_hdf5.
+    """
+
+    group_loaders = {
+        "households": load_households_from_hdf5,
+        "care_homes": load_care_homes_from_hdf5,
+        "schools": load_schools_from_hdf5,
+        "companies": load_companies_from_hdf5,
+        "hospitals": load_hospitals_from_hdf5,
+        "universities": load_universities_from_hdf5,
+    }
+    spec_to_group_type = {
+        "household": "households",
+        "care_home": "care_homes",
+        "school": "schools",
+        "company": "companies",
+        "hospital": "hospitals",
+        "university": "universities",
+    }
+
+    def __init__(self, file_path: str, chunk_size: int = 500000):
+        super().__init__()
+        self.file_path = file_path
+        self.chunk_size = chunk_size
+        self.file = h5py.File(file_path, "r")
+        self.geography = load_geography_from_hdf5(file_path, chunk_size=chunk_size)
+        self.areas = self.geography.areas
+        self.super_areas = self.geography.super_areas
+        self._pending = {name for name in self.group_loaders if name in self.file}
+        for name in self._pending:
+            self.__dict__.pop(name, None)
+        population = self.file["population"]
+        self.columns = {
+            name: mmap_dataset(population[name])
+            for name in ("id", "age", "area", "group_ids", "subgroup_types")
+        }
+        self._load_membership_specs(population["group_specs"])
+        self.people = self._load_people(population)
+        if "commute_hubs" in self.file:
+            self._load_commute()
+        self.cemeteries = Cemeteries()
+
+    def __getattr__(self, name: str):
+        pending = self.__dict__.get("_pending", ())
+        if name not in pending:
+            raise AttributeError(name)
+        return self.materialize(name)
+
+    def _load_membership_specs(self, group_specs: h5py.Dataset):
+        """
+        Encodes the group spec of every membership as a small integer, chunk by
+        chunk, so that the members of a group type are found with one comparison.
+        """
+        self.spec_codes = np.empty(group_specs.shape, dtype=np.int8)
+        self.specs = [b" "]
+        for start in range(0, group_specs.shape[0], self.chunk_size):
+            stop = min(start + self.chunk_size, group_specs.shape[0])
+            chunk = group_specs[start:stop]
+            for spec in np.unique(chunk):
+                if spec not in self.specs:
+                    self.specs.append(spec)
+                self.spec_codes[start:stop][chunk == spec] = self.specs.index(spec)
+
+    def _load_people(self, population: h5py.Group) -> Population:
+        people = []
+        for person_id, age, sex, ethnicity, socioecon_index in zip(
+            self.columns["id"].tolist(),
+            self.columns["age"].tolist(),
+            population["sex"][()].tolist(),
+            population["ethnicity"][()].tolist(),
+            population["socioecon_index"][()].tolist(),
+        ):
+            person = Person.from_attributes(
+                id=person_id,
+                age=age,
+                sex=sex.decode(),
+                ethnicity=ethnicity.decode(),
+                socioecon_index=(
+                    socioecon_index if socioecon_index != nan_integer else None
+                ),
+            )
+            person.subgroups = Activities(None, None, None, None, None, None, None)
+            people.append(person)
+        first_area_id = self.areas.members[0].id
+        for person, area_id in zip(people, self.columns["area"].tolist()):
+            self.areas.members[area_id - first_area_id].add(person)
+        return Population(people)
+
+    def _load_commute(self):
+        """
+        Loads the commute hubs and cities, links them to their commuters and builds
+        their units.
+        """
+        people = self.people.members
+        first_person_id = people[0].id
+        self.commutehubs = load_commute_hubs_from_hdf5(self.file_path)
+        self.commutecities = load_commute_cities_from_hdf5(self.file_path)
+        first_hub_id = self.commutehubs.members[0].id
+        for hub in self.commutehubs:
+            hub.commute_through = [
+                people[person_id - first_person_id] for person_id in hub.commute_through
+            ]
+        for city in self.commutecities:
+            city.commutehubs = [
+                self.commutehubs.members[hub_id - first_hub_id]
+                for hub_id in city.commutehubs
+            ]
+            city.commute_internal = [
+                people[person_id - first_person_id]
+                for person_id in city.commute_internal
+            ]
+        self.commuteunits = CommuteUnits(self.commutehubs.members)
+        self.commuteunits.init_units()
+        self.commutecityunits = CommuteCityUnits(self.commutecities.members)
+        self.commutecityunits.init_units()
+
+    def materialize(self, name: str):
+        """
+        Loads the group type name and links its members to their subgroups.
+        """
+        self._pending.discard(name)
+        groups = self.group_loaders[name](self.file_path, chunk_size=self.chunk_size)
+        setattr(self, name, groups)
+        if not groups.members:
+            return groups
+        specs = [
+            code
+            for code, spec in enumerate(self.specs)
+            if self.spec_to_group_type.get(spec.decode().strip()) == name
+        ]
+        people_idx, activity_idx = np.nonzero(np.isin(self.spec_codes, specs))
+        group_idx = self.columns["group_ids"][people_idx, activity_idx]
+        group_idx = group_idx - groups.members[0].id
+        subgroup_types = self.columns["subgroup_types"][people_idx, activity_idx]
+        people = self.people.members
+        for person_idx, activity, group_idx, subgroup_type in zip(
+            people_idx.tolist(),
+            activity_idx.tolist(),
+            group_idx.tolist(),
+            subgroup_types.tolist(),
+        ):
+            person = people[person_idx]
+            subgroup = groups.members[group_idx][subgroup_type]
+            subgroup.append(person)
+            setattr(person.subgroups, Activities._fields[activity], subgroup)
+        return groups
+
+    def is_loaded(self, name: str) -> bool:
+        return name not in self._pending
+
+    def materialize_all(self):
+        for name in list(self._pending):
+            self.materialize(name)
+
+    def close(self):
+        self.file.close()
+
+
+def generate_lazy_world_from_hdf5(
+    file_path: str, chunk_size: Optional[int] = 500000
+) -> LazyWorld:
+    """
+    Loads the world in file_path, building each group type on first access.
+    """
+    return LazyWorld(file_path, chunk_size=chunk_size)
@@ -0,0 +1,180 @@
+import numba as nb
+import numpy as np
+from typing import Dict, Hashable, List
+
+from june.demography.people_store import sex_to_code
+
+
+def build_alias_table(probabilities: np.array):
+    """
+    Builds Walker/Vose alias tables for sampling from a discrete distribution in O(1).
+
+    Parameters
+    ----------
+    probabilities:
+        unnormalized probabilities of each outcome
+
+    Returns
+    -------
+    acceptance probabilities and alias of each outcome
+    """
+    n_outcomes = len(probabilities)
+    acceptance = np.ones(n_outcomes)
+    alias = np.arange(n_outcomes)
+    total = probabilities.sum()
+    if total <= 0:
+        return acceptance, alias
+    scaled = probabilities * n_outcomes / total
+    small = [i for i in range(n_outcomes) if scaled[i] < 1.0]
+    large = [i for i in range(n_outcomes) if scaled[i] >= 1.0]
+    while small and large:
+        less, more = small.pop(), large.pop()
+        acceptance[less] = scaled[less]
+        alias[less] = more
+        scaled[more] = scaled[more] + scaled[less] - 1.0
+        if scaled[more] < 1.0:
+            small.append(more)
+        else:
+            large.append(more)
+    return acceptance, alias
+
+
+@nb.jit(nopython=True)
+def choose_activities(
+    sexes, ages, does_activity, acceptance, alias, u_does, u_column, u_alias
+):
+    """
+    Picks the leisure activity of many people at once from precomputed alias tables
+    and pre-drawn uniforms; -1 means the person does no activity.
+    """
+    n_activities = acceptance.shape[2]
+    max_age = does_activity.shape[1] - 1
+    activities = np.full(len(sexes), -1, dtype=np.int64)
+    for i in range(len(sexes)):
+        sex = sexes[i]
+        age = min(ages[i], max_age)
+        if u_does[i] >= does_activity[sex, age]:
+            continue
+        column = min(int(u_column[i] * n_activities), n_activities - 1)
+        if u_alias[i] < acceptance[sex, age, column]:
+            activities[i] = column
+        else:
+            activities[i] = alias[sex, age, column]
+    return activities
+
+
+class LeisureActivityTables:
+    """
+    Leisure probabilities of one (day type, policy state) compiled into arrays
+    indexed by [sex, age, activity], so that choosing an activity is an O(1) lookup
+    instead of rebuilding arrays out of the probability dictionaries for every person.
+    """
+
+    def __init__(
+        self,
+        activities: List[str],
+        does_activity: np.array,
+        acceptance: np.array,
+        alias: np.array,
+        drags_household: np.array,
+    ):
+        self.activities = activities
+        self.does_activity = does_activity
+        self.acceptance = acceptance
+        self.alias = alias
+        self.drags_household = drags_household
+
+    @classmethod
+    def from_probabilities(cls, probabilities_by_age_sex: dict):
+        """
+        Parameters
+        ----------
+        probabilities_by_age_sex:
+            leisure probabilities as generated by Leisure, indexed by sex and age, with
+            "does_activity", "activities" and "drags_household" entries
+        """
+        activities = []
+        for probabilities_by_age in probabilities_by_age_sex.values():
+            for prob_age_sex in probabilities_by_age.values():
+                for activity in prob_age_sex["activities"]:
+                    if activity not in activities:
+                        activities.append(activity)
+        n_ages = 1 + max(
+            max(probabilities_by_age)
+            for probabilities_by_age in probabilities_by_age_sex.values()
+        )
+        shape = (len(sex_to_code), n_ages, len(activities))
+        does_activity = np.zeros(shape[:2])
+        acceptance = np.ones(shape)
+        alias = np.tile(np.arange(len(activities)), shape[:2] + (1,))
+        drags_household = np.zeros(shape)
+        for sex, probabilities_by_age in probabilities_by_age_sex.items():
+            sex_code = sex_to_code[sex]
+            for age, prob_age_sex in probabilities_by_age.items():
+                does_activity[sex_code, age] = prob_age_sex["does_activity"]
+                activity_probabilities = np.array(
+                    [
+                        prob_age_sex["activities"].get(activity, 0.0)
+                        for activity in activities
+                    ]
+                )
+                (
+                    acceptance[sex_code, age],
+                    alias[sex_code, age],
+                ) = build_alias_table(activity_probabilities)
+                for activity, probability in prob_age_sex["drags_household"].items():
+                    activity_idx = activities.index(activity)
+                    drags_household[sex_code, age, activity_idx] = probability
+        return cls(
+            activities=activities,
+            does_activity=does_activity,
+            acceptance=acceptance,
+            alias=alias,
+            drags_household=drags_household,
+        )
+
+    def choose(self, sexes: np.array, ages: np.array, rng: np.random.Generator):
+        """
+        Draws the leisure activity index of each person (-1 for no activity).
+
+        Parameters
+        ----------
+        sexes:
+            sex codes of the people, as in PeopleStore
+        ages:
+            ages of the people
+        """
+        uniforms = rng.random((3, len(sexes)))
+        return self.choose_with_uniforms(sexes, ages, uniforms)
+
+    def choose_with_uniforms(self, sexes: np.array, ages: np.array, uniforms: np.array):
+        """
+        Same as choose, with the three uniforms per person already drawn.
+        """
+        return choose_activities(
+            sexes,
+            ages,
+            self.does_activity,
+            self.acceptance,
+            self.alias,
+            uniforms[0],
+            uniforms[1],
+            uniforms[2],
+        )
+
+
+class LeisureTablesCache:
+    """
+    Compiled leisure tables, one per (weekday/weekend, policy state, ...) key; the
+    tables are only compiled the first time a key is seen.
+    """
+
+    def __init__(self):
+        self.tables: Dict[Hashable, LeisureActivityTables] = {}
+
+    def get(self, key: Hashable, probabilities_by_age_sex: dict) -> LeisureActivityTables:
+        if key not in self.tables:
+            self.tables[key] = LeisureActivityTables.from_probabilities(
+                probabilities_by_age_sex
+            )
+        return self.tables[key]
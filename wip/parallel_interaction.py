@@ -0,0 +1,200 @@
+import numpy as np
+from multiprocessing import get_context
+from multiprocessing.shared_memory import SharedMemory
+from typing import List, Tuple
+
+from june.interaction.interaction import (
+    Interaction,
+    InteractiveGroupBatch,
+    compute_effective_transmission_batch,
+    infection_samplers,
+)
+from june.random_streams import CounterRNG
+
+shared_batch_arrays = (
+    "susceptible_group_idx",
+    "susceptible_subgroups",
+    "susceptible_offsets",
+    "susceptible_ids",
+    "infector_offsets",
+    "infector_subgroups",
+    "infector_subgroup_sizes",
+    "transmission_probabilities",
+)
+
+
+class SharedArrays:
+    """
+    Copies a set of arrays into multiprocessing.shared_memory blocks, so that worker
+    processes can attach to them by name instead of receiving them pickled.
+    """
+
+    def __init__(self, arrays: dict):
+        self.blocks = []
+        self.description = {}
+        for name, array in arrays.items():
+            array = np.ascontiguousarray(array)
+            block = SharedMemory(create=True, size=max(array.nbytes, 1))
+            np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[:] = array
+            self.blocks.append(block)
+            self.description[name] = (block.name, array.shape, array.dtype.str)
+
+    def release(self):
+        for block in self.blocks:
+            block.close()
+            block.unlink()
+        self.blocks = []
+
+
+def _attach(description: dict):
+    blocks = []
+    arrays = {}
+    for name, (block_name, shape, dtype) in description.items():
+        block = SharedMemory(name=block_name)
+        blocks.append(block)
+        arrays[name] = np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf)
+    return blocks, arrays
+
+
+def _time_step_slice(
+    description: dict,
+    start: int,
+    stop: int,
+    n_groups: int,
+    sampling: str,
+    rng,
+) -> Tuple[np.array, np.array]:
+    """
+    Worker side of the parallel time step: runs the transmission kernel on the
+    susceptible subgroups [start, stop) of a shared batch.
+
+    Returns
+    -------
+    the newly infected ids and the number of infections per group of the batch.
+    """
+    blocks, arrays = _attach(description)
+    try:
+        susceptible_offsets = arrays["susceptible_offsets"][start : stop + 1]
+        susceptible_group_idx = arrays["susceptible_group_idx"][start:stop]
+        susceptible_ids = arrays["susceptible_ids"][
+            susceptible_offsets[0] : susceptible_offsets[-1]
+        ]
+        effective_transmission_probabilities = compute_effective_transmission_batch(
+            susceptible_group_idx=susceptible_group_idx,
+            susceptible_subgroups=arrays["susceptible_subgroups"][start:stop],
+            infector_offsets=arrays["infector_offsets"],
+            infector_subgroups=arrays["infector_subgroups"],
+            infector_subgroup_sizes=arrays["infector_subgroup_sizes"],
+            transmission_probabilities=arrays["transmission_probabilities"],
+            transmission_tensor=arrays["transmission_tensor"],
+            group_layouts=arrays["group_layouts"],
+        )
+        relative_offsets = susceptible_offsets - susceptible_offsets[0]
+        infected_mask = infection_samplers[sampling](
+            effective_transmission_probabilities,
+            relative_offsets,
+            susceptible_ids,
+            rng,
+        )
+        group_of_susceptible = np.repeat(
+            susceptible_group_idx, np.diff(relative_offsets)
+        )
+        # copy out of the shared buffers before they are closed
+        infected_ids = np.array(susceptible_ids[infected_mask])
+        n_infected_per_group = np.bincount(
+            group_of_susceptible[infected_mask], minlength=n_groups
+        )
+    finally:
+        del arrays
+        for block in blocks:
+            block.close()
+    return infected_ids, n_infected_per_group
+
+
+class ParallelInteraction:
+    """
+    Runs the batched transmission of a group type on a pool of worker processes.
+    The interaction inputs of the step are exported to shared memory, each worker
+    handles a disjoint slice of the groups, and only the new infected ids and the
+    infections per group come back.
+    """
+
+    def __init__(
+        self,
+        interaction: Interaction,
+        n_processes: int,
+        min_subgroups_per_process: int = 1000,
+    ):
+        self.interaction = interaction
+        self.n_processes = n_processes
+        self.min_subgroups_per_process = min_subgroups_per_process
+        self.pool = get_context("spawn").Pool(n_processes)
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+
+    def _slices(self, batch: InteractiveGroupBatch) -> List[Tuple[int, int]]:
+        """
+        Splits the susceptible subgroups of the batch into ranges that never split a
+        group, with roughly the same number of subgroups each.
+        """
+        n_subgroups = len(batch.susceptible_group_idx)
+        n_slices = min(
+            self.n_processes, n_subgroups // self.min_subgroups_per_process
+        )
+        if n_slices <= 1:
+            return []
+        boundaries = np.linspace(0, n_subgroups, n_slices + 1).astype(int)
+        # move every boundary to the first subgroup of its group
+        first_subgroup_of_group = np.searchsorted(
+            batch.susceptible_group_idx, batch.susceptible_group_idx[boundaries[1:-1]]
+        )
+        boundaries[1:-1] = first_subgroup_of_group
+        boundaries = np.unique(boundaries)
+        return list(zip(boundaries[:-1], boundaries[1:]))
+
+    def time_step_for_group_type(
+        self, delta_time: float, batch: InteractiveGroupBatch
+    ):
+        """
+        Same as Interaction.time_step_for_group_type, but run on the pool when the batch
+        is large enough.
+        """
+        slices = self._slices(batch)
+        if not slices:
+            return self.interaction.time_step_for_group_type(delta_time, batch)
+        arrays = {name: getattr(batch, name) for name in shared_batch_arrays}
+        (
+            arrays["transmission_tensor"],
+            arrays["group_layouts"],
+        ) = self.interaction.batch_transmission(batch, delta_time)
+        shared = SharedArrays(arrays)
+        if isinstance(self.interaction.rng, CounterRNG):
+            # keyed by person id, every slice can use the same generator
+            rngs = [self.interaction.rng] * len(slices)
+        else:
+            rngs = [
+                np.random.default_rng(seed)
+                for seed in self.interaction.rng.integers(2 ** 63, size=len(slices))
+            ]
+        try:
+            results = self.pool.starmap(
+                _time_step_slice,
+                [
+                    (
+                        shared.description,
+                        start,
+                        stop,
+                        batch.n_groups,
+                        self.interaction.sampling,
+                        rng,
+                    )
+                    for (start, stop), rng in zip(slices, rngs)
+                ],
+            )
+        finally:
+            shared.release()
+        infected_ids = np.concatenate([result[0] for result in results])
+        n_infected_per_group = np.sum([result[1] for result in results], axis=0)
+        return infected_ids, n_infected_per_group
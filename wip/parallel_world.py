@@ -0,0 +1,213 @@
+import logging
+import random
+import time
+from multiprocessing import get_context
+from pathlib import Path
+from typing import List, Optional
+
+import numpy as np
+
+from june.demography.geography import Geography, Areas, SuperAreas
+from june.demography import Population
+from june.distributors import (
+    CompanyDistributor,
+    HospitalDistributor,
+    SchoolDistributor,
+    UniversityDistributor,
+    WorkerDistributor,
+)
+from june.groups import (
+    CareHomes,
+    Cemeteries,
+    Companies,
+    Hospitals,
+    Households,
+    Schools,
+    Universities,
+)
+from june.world import World, generate_world_from_geography, generate_world_from_hdf5
+
+logger = logging.getLogger(__name__)
+
+# default chunk size: the chunks only depend on the super areas, not on the number of
+# processes, so the world generated with a seed does not either
+super_areas_per_chunk = 20
+
+group_types = {
+    "households": Households,
+    "schools": Schools,
+    "care_homes": CareHomes,
+    "companies": Companies,
+    "hospitals": Hospitals,
+    "universities": Universities,
+}
+
+
+def _generate_chunk(
+    chunk_idx: int,
+    super_areas: List[str],
+    file_path: str,
+    include_households: bool,
+    seed: Optional[int],
+) -> tuple:
+    """
+    Builds the part of the world that only depends on the given super areas
+    (people, care homes and their residents, households, schools and their pupils,
+    plus the empty companies, hospitals and universities) and saves it to file_path.
+
+    Returns
+    -------
+    the number of people of the chunk and the time spent saving it.
+    """
+    if seed is not None:
+        np.random.seed([seed, chunk_idx])
+        random.seed(f"{seed}-{chunk_idx}")
+    geography = Geography.from_file({"super_area": super_areas})
+    # care homes are populated before the households, so that their residents are
+    # not given a household too
+    geography.care_homes = CareHomes.for_geography(geography)
+    world = generate_world_from_geography(
+        geography, include_households=include_households, include_commute=False
+    )
+    world.schools = Schools.for_geography(geography)
+    SchoolDistributor(world.schools).distribute_kids_to_school(world.areas)
+    world.companies = Companies.for_geography(geography)
+    world.hospitals = Hospitals.for_geography(geography)
+    world.universities = Universities.for_super_areas(geography.super_areas)
+    start = time.perf_counter()
+    world.to_hdf5(file_path)
+    return len(world.people), time.perf_counter() - start
+
+
+def _renumber(objects: list):
+    for new_id, item in enumerate(objects):
+        item.id = new_id
+
+
+def merge_worlds(worlds: List[World]) -> World:
+    """
+    Concatenates worlds built on disjoint sets of super areas. Areas, super areas,
+    people and the groups of every type are renumbered in the order of the worlds,
+    so that ids are the same whatever process built each world.
+    """
+    areas, super_areas, people = [], [], []
+    groups = {name: [] for name in group_types}
+    for chunk_world in worlds:
+        areas.extend(chunk_world.areas.members)
+        super_areas.extend(chunk_world.super_areas.members)
+        people.extend(chunk_world.people.members)
+        for name in group_types:
+            supergroup = getattr(chunk_world, name, None)
+            if supergroup is not None:
+                groups[name].extend(supergroup.members)
+    _renumber(areas)
+    _renumber(super_areas)
+    _renumber(people)
+    world = World()
+    world.areas = Areas(areas)
+    world.super_areas = SuperAreas(super_areas)
+    world.people = Population(people)
+    for name, supergroup_class in group_types.items():
+        _renumber(groups[name])
+        setattr(world, name, supergroup_class(groups[name]))
+    return world
+
+
+def distribute_across_super_areas(world: World, include_commute: bool = False):
+    """
+    Steps of the world generation that link people to groups outside their own
+    super area: work places (companies, teachers, medics), universities and
+    commuting.
+    """
+    geography = Geography(world.areas, world.super_areas)
+    WorkerDistributor.for_geography(geography).distribute(
+        areas=world.areas, super_areas=world.super_areas, population=world.people
+    )
+    CompanyDistributor().distribute_adults_to_companies_in_super_areas(
+        world.super_areas
+    )
+    SchoolDistributor(world.schools).distribute_teachers_to_schools_in_super_areas(
+        world.super_areas
+    )
+    HospitalDistributor.from_file(world.hospitals).distribute_medics_to_super_areas(
+        world.super_areas
+    )
+    UniversityDistributor(world.universities).distribute_students_to_universities(
+        world.super_areas
+    )
+    if include_commute:
+        world.initialise_commuting()
+
+
+def generate_world_in_parallel(
+    super_areas: List[str],
+    n_processes: int,
+    n_chunks: Optional[int] = None,
+    save_path: str = "world_chunks",
+    include_households: bool = True,
+    include_commute: bool = False,
+    seed: Optional[int] = None,
+) -> World:
+    """
+    Generates the world of the given super areas by splitting them into chunks of
+    consecutive super areas, building each chunk in a process pool and merging the
+    chunks; the cross super area steps are then run once on the merged world.
+
+    Pupils only go to schools in their own chunk, so people living near the edge of
+    a chunk can be assigned a different school than in a serial generation.
+
+    Parameters
+    ----------
+    super_areas:
+        names of the super areas of the world
+    n_processes:
+        number of worker processes
+    n_chunks:
+        number of chunks the super areas are split into, by default one per
+        super_areas_per_chunk super areas
+    save_path:
+        directory of the HDF5 file of every chunk
+    seed:
+        if given, chunk i is generated with its random generators seeded with
+        (seed, i), which makes the world reproducible for a fixed n_chunks (whatever
+        n_processes is); it is not the same world for different n_chunks
+    """
+    super_areas = list(super_areas)
+    if n_chunks is None:
+        n_chunks = -(-len(super_areas) // super_areas_per_chunk)
+    chunks = [
+        list(chunk)
+        for chunk in np.array_split(
+            super_areas, max(1, min(n_chunks, len(super_areas)))
+        )
+    ]
+    save_path = Path(save_path)
+    save_path.mkdir(parents=True, exist_ok=True)
+    file_paths = [str(save_path / f"world_{idx:04d}.hdf5") for idx in range(len(chunks))]
+    with get_context("spawn").Pool(n_processes, maxtasksperchild=1) as pool:
+        chunk_results = pool.starmap(
+            _generate_chunk,
+            [
+                (idx, chunk, file_path, include_households, seed)
+                for idx, (chunk, file_path) in enumerate(zip(chunks, file_paths))
+            ],
+        )
+    n_people, save_times = zip(*chunk_results)
+    logger.info(f"Generated {sum(n_people)} people in {len(chunks)} chunks")
+    # the chunks go through HDF5 rather than being pickled back: the object graph of
+    # a world (people <-> groups <-> areas) is too deeply linked for pickle. Loading
+    # and merging is serial in this process, so its cost is logged next to the
+    # (parallel) saving cost
+    start = time.perf_counter()
+    chunk_worlds = [generate_world_from_hdf5(path) for path in file_paths]
+    load_time = time.perf_counter() - start
+    start = time.perf_counter()
+    world = merge_worlds(chunk_worlds)
+    merge_time = time.perf_counter() - start
+    logger.info(
+        f"Saving the chunks took {max(save_times):.1f} s (slowest chunk), loading "
+        f"them {load_time:.1f} s and merging {merge_time:.1f} s in this process"
+    )
+    distribute_across_super_areas(world, include_commute=include_commute)
+    world.cemeteries = Cemeteries()
+    return world
@@ -0,0 +1,113 @@
+import numpy as np
+from scipy.stats import gamma
+
+sex_to_code = {"m": 0, "f": 1}
+# symptom tag values can be negative (e.g. exposed), so not infected needs its own value
+not_infected = np.iinfo(np.int8).min
+
+
+class PeopleStore:
+    """
+    Columns of the per person state that the batched code paths read for the whole
+    population at once (age, sex, susceptibility, dead flag, residence), kept as
+    typed arrays indexed by the position of the person in the id-sorted population.
+
+    The Person objects stay the reference for everything else (subgroups, busy,
+    health information); the columns are a copy kept in sync by the simulator, so
+    they add memory per person rather than save it.
+
+    The infection columns hold the current symptom tag value of each infected
+    person (not_infected otherwise), their transmission probability and the number of
+    secondary infections blamed on them. For gamma shaped transmissions the start of
+    the infection and the gamma parameters are kept too, so the time dependent
+    probabilities of all those people are computed at once.
+    """
+
+    def __init__(self, people: np.array):
+        n_people = len(people)
+        self.people = people
+        self.ids = np.fromiter((person.id for person in people), np.int64, n_people)
+        self.first_id = self.ids[0] if n_people else 0
+        self.ages = np.fromiter((person.age for person in people), np.int16, n_people)
+        self.sexes = np.fromiter(
+            (sex_to_code[person.sex] for person in people), np.int8, n_people
+        )
+        self.susceptibility = np.fromiter(
+            (person.susceptibility for person in people), np.float32, n_people
+        )
+        self.dead = np.fromiter((person.dead for person in people), bool, n_people)
+        self.symptom_tag = np.full(n_people, not_infected, dtype=np.int8)
+        self.transmission_probability = np.zeros(n_people, dtype=np.float32)
+        self.number_of_infected = np.zeros(n_people, dtype=np.float32)
+        self.infection_start_time = np.zeros(n_people, dtype=np.float64)
+        self.transmission_norm = np.zeros(n_people, dtype=np.float64)
+        self.transmission_shape = np.ones(n_people, dtype=np.float64)
+        self.transmission_shift = np.zeros(n_people, dtype=np.float64)
+        self.transmission_scale = np.ones(n_people, dtype=np.float64)
+        # residence (group) of everyone, and whether it is quarantined
+        self.residences = []
+        self._residence_to_index = {}
+        self.residence_idx = np.full(n_people, -1, dtype=np.int32)
+        for idx, person in enumerate(people):
+            residence = person.subgroups.residence
+            if residence is not None:
+                self.residence_idx[idx] = self._residence_to_index.setdefault(
+                    id(residence.group), len(self._residence_to_index)
+                )
+                if self.residence_idx[idx] == len(self.residences):
+                    self.residences.append(residence.group)
+        self.quarantined_residences = np.fromiter(
+            (
+                getattr(residence, "quarantine_starting_date", None) is not None
+                for residence in self.residences
+            ),
+            bool,
+            len(self.residences),
+        )
+
+    def __len__(self):
+        return len(self.ids)
+
+    def index_of(self, ids):
+        """
+        Position in the store of the given person id(s).
+        """
+        return ids - self.first_id
+
+    def add_blame(self, infector_ids: np.array, blame: np.array):
+        """
+        Adds secondary infections to the given infectors (ids may repeat).
+        """
+        np.add.at(self.number_of_infected, self.index_of(infector_ids), blame)
+
+    def quarantine_residence(self, residence: "Group"):
+        self.quarantined_residences[self._residence_to_index[id(residence)]] = True
+
+    def set_gamma_transmission(self, idx: int, infection: "Infection"):
+        transmission = infection.transmission
+        self.infection_start_time[idx] = infection.start_time
+        self.transmission_norm[idx] = transmission.norm
+        self.transmission_shape[idx] = transmission.shape
+        self.transmission_shift[idx] = transmission.shift
+        self.transmission_scale[idx] = transmission.scale
+
+    def gamma_transmission_probabilities(self, idx: np.array, time: float) -> np.array:
+        """
+        Transmission probabilities at time of the people at idx, whose gamma
+        transmission parameters were stored with set_gamma_transmission (the same as
+        TransmissionGamma.update_probability_from_delta_time, for all of them at once).
+        """
+        return self.transmission_norm[idx] * gamma.pdf(
+            time - self.infection_start_time[idx],
+            a=self.transmission_shape[idx],
+            loc=self.transmission_shift[idx],
+            scale=self.transmission_scale[idx],
+        )
+
+    @property
+    def infected_idx(self) -> np.array:
+        return np.flatnonzero(self.symptom_tag != not_infected)
+
+    def set_dead(self, idx: int):
+        self.dead[idx] = True
+
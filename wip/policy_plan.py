@@ -0,0 +1,164 @@
+from bisect import bisect_right
+from datetime import datetime
+from typing import List, Optional
+
+import numpy as np
+
+from june.demography.people_store import not_infected
+from june.policy import (
+    Policies,
+    IndividualPolicies,
+    InteractionPolicies,
+    MedicalCarePolicies,
+)
+
+
+def is_stochastic(policy) -> bool:
+    """
+    Whether an individual policy draws random numbers when applied (e.g. the
+    probability of going to work of CloseCompanies, or a compliance below one), so
+    that its result for a person cannot be kept for the whole period.
+    """
+    return any(
+        ("probability" in name or "compliance" in name)
+        and isinstance(value, (int, float))
+        and 0 < value < 1
+        for name, value in vars(policy).items()
+    )
+
+
+class PolicyPlan:
+    """
+    The active interaction, individual and medical care policies of a period
+    between two policy change dates, plus the deterministic individual policies
+    compiled into a per person code of allowed activities.
+
+    A person is only compiled while their allowed activities cannot change from
+    one step to the next (see PolicyPlan.dynamic_mask); people that are dynamic in a
+    step go through IndividualPolicies.apply instead, and are compiled the first
+    step they are not dynamic anymore. Stochastic policies are never compiled: they
+    are applied every step on top of the compiled activities.
+    """
+
+    def __init__(self, policies: Optional[Policies], date: datetime):
+        self.interaction_policies = InteractionPolicies.get_active_policies(
+            policies=policies, date=date
+        )
+        self.individual_policies = IndividualPolicies.get_active_policies(
+            policies=policies, date=date
+        )
+        self.medical_care_policies = MedicalCarePolicies.get_active_policies(
+            policies=policies, date=date
+        )
+        individual_policies = self.individual_policies.policies
+        self.compiled_policies = IndividualPolicies(
+            [policy for policy in individual_policies if not is_stochastic(policy)]
+        )
+        self.stochastic_policies = IndividualPolicies(
+            [policy for policy in individual_policies if is_stochastic(policy)]
+        )
+        self._codes = {}
+        self._code_to_activities = {}
+
+    @staticmethod
+    def dynamic_mask(people_store: "PeopleStore") -> np.array:
+        """
+        Mask of the people whose allowed activities depend on their current health
+        or quarantine status, and thus need to be evaluated every step: the infected
+        and everyone living in a quarantined residence.
+        """
+        quarantined = np.zeros(len(people_store), dtype=bool)
+        housed = people_store.residence_idx >= 0
+        quarantined[housed] = people_store.quarantined_residences[
+            people_store.residence_idx[housed]
+        ]
+        return (people_store.symptom_tag != not_infected) | quarantined
+
+    def codes(self, activities: List[str], n_people: int) -> np.array:
+        """
+        Compiled allowed activities code of every person for the given activities,
+        -1 for the people not compiled yet (those that were dynamic so far).
+        """
+        key = tuple(activities)
+        codes = self._codes.get(key)
+        if codes is None:
+            codes = np.full(n_people, -1, dtype=np.int64)
+            self._codes[key] = codes
+        return codes
+
+    def _compile(
+        self,
+        codes: np.array,
+        person_idx: int,
+        person: "Person",
+        key: tuple,
+        days_from_start: float,
+    ) -> int:
+        allowed = self.compiled_policies.apply(
+            person=person, activities=list(key), days_from_start=days_from_start,
+        )
+        codes[person_idx] = sum(
+            1 << bit for bit, activity in enumerate(key) if activity in allowed
+        )
+        return codes[person_idx]
+
+    def allowed_activities(
+        self,
+        codes: np.array,
+        person_idx: int,
+        person: "Person",
+        activities: List[str],
+        days_from_start: float,
+        dynamic: bool,
+    ) -> List[str]:
+        """
+        Allowed activities of a person: all the policies are applied to dynamic
+        people, the others get their compiled activities (compiled here the first
+        time, into the codes of PolicyPlan.codes) with only the stochastic policies
+        applied on top.
+        """
+        if dynamic:
+            return self.individual_policies.apply(
+                person=person, activities=activities, days_from_start=days_from_start,
+            )
+        key = tuple(activities)
+        code = codes[person_idx]
+        if code < 0:
+            code = self._compile(codes, person_idx, person, key, days_from_start)
+        if (key, code) not in self._code_to_activities:
+            self._code_to_activities[(key, code)] = [
+                activity for bit, activity in enumerate(key) if code & (1 << bit)
+            ]
+        allowed = self._code_to_activities[(key, code)]
+        if self.stochastic_policies.policies:
+            return self.stochastic_policies.apply(
+                person=person,
+                activities=list(allowed),
+                days_from_start=days_from_start,
+            )
+        return allowed
+
+
+class PolicyPlans:
+    """
+    Keeps the PolicyPlan of the current period and only rebuilds it when the date
+    crosses the start or end date of a policy.
+    """
+
+    def __init__(self, policies: Optional[Policies]):
+        self.policies = policies
+        if policies is None:
+            boundaries = []
+        else:
+            boundaries = {policy.start_time for policy in policies.policies}
+            boundaries |= {policy.end_time for policy in policies.policies}
+        self.boundaries = sorted(boundaries)
+        self.plan = None
+        self.period = None
+
+    def plan_for(self, date: datetime) -> PolicyPlan:
+        period = bisect_right(self.boundaries, date)
+        if self.plan is None or period != self.period:
+            self.plan = PolicyPlan(self.policies, date)
+            self.period = period
+        return self.plan
@@ -0,0 +1,74 @@
+import zlib
+from typing import Optional
+
+import numpy as np
+
+_golden = np.uint64(0x9E3779B97F4A7C15)
+_mix_1 = np.uint64(0xBF58476D1CE4E5B9)
+_mix_2 = np.uint64(0x94D049BB133111EB)
+
+
+def _mix(x: np.array) -> np.array:
+    """
+    SplitMix64 finalizer: a bijection of the 64 bit integers that spreads every
+    input bit over the whole output.
+    """
+    x = (x ^ (x >> np.uint64(30))) * _mix_1
+    x = (x ^ (x >> np.uint64(27))) * _mix_2
+    return x ^ (x >> np.uint64(31))
+
+
+def stream_code(stream: str) -> np.uint64:
+    return np.uint64(zlib.crc32(stream.encode()))
+
+
+class CounterRNG:
+    """
+    Counter-based random numbers: every draw is a hash of (seed, step, stream, key,
+    draw number), where the key is a person (or group) id. The numbers a person gets
+    in a step therefore do not depend on the order in which people are visited, nor
+    on how the work is split between threads, processes or ranks, so parallel and
+    serial runs draw exactly the same numbers.
+
+    It only holds the seed and step, so it is cheap to send to worker processes.
+    """
+
+    def __init__(self, seed: Optional[int], step: int):
+        if seed is None:
+            seed = np.random.SeedSequence().entropy
+        self.seed = int(seed) % 2 ** 64
+        self.step = int(step)
+        with np.errstate(over="ignore"):
+            self.step_key = _mix(
+                np.uint64(self.seed) + _golden * np.uint64(self.step + 1)
+            )
+
+    def uniforms(self, stream: str, keys: np.array, n_draws: int = 1) -> np.array:
+        """
+        Uniforms in [0, 1) of shape (n_draws, len(keys)): row i is the i-th draw of
+        each key in the given stream (e.g. "infection", "leisure").
+        """
+        keys = np.asarray(keys).astype(np.uint64)
+        with np.errstate(over="ignore"):
+            hashed = _mix(_mix(self.step_key ^ stream_code(stream)) ^ keys)
+            draws = _golden * (np.arange(n_draws, dtype=np.uint64) + np.uint64(1))
+            bits = _mix(hashed[np.newaxis, :] + draws[:, np.newaxis])
+        return (bits >> np.uint64(11)) * (1.0 / 2 ** 53)
+
+    def bernoulli(self, stream: str, keys: np.array, probabilities: np.array):
+        """
+        Mask of the keys whose draw succeeds with the given probabilities.
+        """
+        return self.uniforms(stream, keys)[0] < probabilities
+
+
+def keyed_uniforms(
+    rng, stream: str, keys: np.array, n_draws: int = 1
+) -> np.array:
+    """
+    Uniforms of shape (n_draws, len(keys)), keyed by the keys if rng is a
+    CounterRNG, and otherwise drawn in order from the numpy Generator rng.
+    """
+    if isinstance(rng, CounterRNG):
+        return rng.uniforms(stream, keys, n_draws)
+    return rng.random((n_draws, len(keys)))
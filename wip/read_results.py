@@ -0,0 +1,350 @@
+from datetime import datetime
+from pathlib import Path
+from typing import List, Optional
+
+import h5py
+import numpy as np
+import pandas as pd
+
+from june.demography.people_store import not_infected
+from june.infection import SymptomTag
+from june.logger.read_logger import ReadLogger
+
+tag_values = sorted(tag.value for tag in SymptomTag)
+tag_names = [SymptomTag(value).name for value in tag_values]
+infected_names = [
+    SymptomTag(value).name
+    for value in tag_values
+    if SymptomTag.exposed.value <= value <= SymptomTag.intensive_care.value
+]
+dead_names = [name for name in tag_names if name.startswith("dead")]
+ended_tags = [SymptomTag.recovered.value] + [
+    SymptomTag[name].value for name in dead_names
+]
+hospital_tags = [SymptomTag.hospitalised.value, SymptomTag.intensive_care.value]
+event_columns = ["new_infections", "hospital_admissions", "intensive_care_admissions"]
+
+
+class ReadResults(ReadLogger):
+    """
+    Analysis of the results written by the ResultsWriter (results.h5).
+
+    The infected and infection location datasets are read in chunks of rows and
+    reduced with groupby / bincount as they are read, so only the summaries (and a
+    few per person arrays) are ever held in memory. The hospital capacity is read
+    from results.h5 too; hospital characteristics and parameters are still read
+    from the Logger file by the ReadLogger methods.
+
+    The per step summaries count the people in every symptom tag at each step;
+    recovered and dead people are only logged on the step their infection ends,
+    so those columns (and the admissions) are new cases per step.
+    """
+
+    def __init__(
+        self,
+        output_path: str = "results",
+        output_file_name: str = "logger.hdf5",
+        results_file_name: str = "results.h5",
+        chunk_size: int = 1_000_000,
+    ):
+        self.output_path = Path(output_path)
+        self.file_path = self.output_path / output_file_name
+        self.results_path = self.output_path / results_file_name
+        self.chunk_size = chunk_size
+        with h5py.File(self.results_path, "r") as f:
+            self.dates = pd.to_datetime(f["steps/date"][:].astype(str))
+            population = f["population"]
+            self.ids = population["id"][:]
+            self.ages = population["age"][:]
+            self.sexes = population["sex"][:]
+            self.super_areas = population["super_area"][:]
+            self.super_area_names = f["super_areas/name"][:].astype(str)
+            if "locations/names" in f:
+                self.location_names = f["locations/names"][:].astype(str)
+            else:
+                self.location_names = np.array([], dtype=str)
+        self.n_people = len(self.ids)
+        self.n_steps = len(self.dates)
+        self.start_date = self.dates.min()
+        self.end_date = self.dates.max()
+
+    def index_of(self, ids: np.array) -> np.array:
+        """
+        Position in the population of the given (id sorted) person ids.
+        """
+        return np.searchsorted(self.ids, ids)
+
+    def _read_chunks(self, group: str, columns: List[str]):
+        with h5py.File(self.results_path, "r") as f:
+            if group not in f:
+                return
+            n_rows = f[f"{group}/step"].shape[0]
+            for start in range(0, n_rows, self.chunk_size):
+                stop = min(start + self.chunk_size, n_rows)
+                yield {column: f[f"{group}/{column}"][start:stop] for column in columns}
+
+    def _summary(self, person_groups: np.array, group_sizes: np.array) -> pd.DataFrame:
+        """
+        Per step and group counts of every symptom tag, new infections and hospital
+        and intensive care admissions, plus the infected, dead and susceptible totals.
+
+        Parameters
+        ----------
+        person_groups:
+            group code of every person in the population (-1 to leave them out)
+        group_sizes:
+            number of people in each group
+
+        Returns
+        -------
+        data frame indexed by time_stamp with a group column
+        """
+        last_tag = np.full(self.n_people, not_infected, dtype=np.int8)
+        counts, events = [], []
+        for chunk in self._read_chunks("infected", ["step", "id", "symptoms"]):
+            idx = self.index_of(chunk["id"])
+            # rows are appended in step order, a stable sort keeps each person's history
+            order = np.argsort(idx, kind="stable")
+            idx = idx[order]
+            tags = chunk["symptoms"][order]
+            first = np.ones(len(idx), dtype=bool)
+            first[1:] = idx[1:] != idx[:-1]
+            last = np.ones(len(idx), dtype=bool)
+            last[:-1] = first[1:]
+            previous_tags = np.empty_like(tags)
+            previous_tags[1:] = tags[:-1]
+            previous_tags[first] = last_tag[idx[first]]
+            last_tag[idx[last]] = tags[last]
+            in_hospital = np.isin(tags, hospital_tags)
+            frame = pd.DataFrame(
+                {
+                    "step": chunk["step"][order],
+                    "group": person_groups[idx],
+                    "tag": tags,
+                    "new_infections": previous_tags == not_infected,
+                    "hospital_admissions": in_hospital
+                    & ~np.isin(previous_tags, hospital_tags),
+                    "intensive_care_admissions": (
+                        tags == SymptomTag.intensive_care.value
+                    )
+                    & (previous_tags != SymptomTag.intensive_care.value),
+                }
+            )
+            frame = frame[frame.group >= 0]
+            counts.append(frame.groupby(["step", "group", "tag"]).size())
+            events.append(frame.groupby(["step", "group"])[event_columns].sum())
+        if counts:
+            summary = (
+                pd.concat(counts)
+                .groupby(level=[0, 1, 2])
+                .sum()
+                .unstack("tag", fill_value=0)
+                .reindex(columns=tag_values, fill_value=0)
+            )
+            summary.columns = tag_names
+            summary = summary.join(pd.concat(events).groupby(level=[0, 1]).sum())
+            groups = summary.index.get_level_values("group").unique().sort_values()
+        else:
+            groups = []
+            summary = pd.DataFrame(
+                columns=tag_names + event_columns,
+                index=pd.MultiIndex.from_product([[], groups], names=["step", "group"]),
+                dtype=np.int64,
+            )
+        summary = summary.reindex(
+            pd.MultiIndex.from_product(
+                [np.arange(self.n_steps), groups], names=["step", "group"]
+            ),
+            fill_value=0,
+        ).astype(np.int64)
+        summary["infected"] = summary[infected_names].sum(axis=1)
+        summary["dead"] = summary[dead_names].sum(axis=1)
+        group_codes = summary.index.get_level_values("group").values
+        summary["susceptible"] = group_sizes[group_codes] - summary.groupby(
+            level="group"
+        ).new_infections.cumsum()
+        summary = summary.reset_index("group")
+        summary.index = self.dates[summary.index.values]
+        summary.index.name = "time_stamp"
+        return summary
+
+    def world_summary(self) -> pd.DataFrame:
+        """
+        Per step counts over the whole population.
+        """
+        return self._summary(
+            np.zeros(self.n_people, dtype=np.int64), np.array([self.n_people])
+        ).drop(columns="group")
+
+    def super_area_summary(self) -> pd.DataFrame:
+        """
+        Per step counts in every super area (long format, super_area column).
+        """
+        group_sizes = np.bincount(
+            self.super_areas, minlength=len(self.super_area_names)
+        )
+        summary = self._summary(self.super_areas, group_sizes)
+        summary["super_area"] = self.super_area_names[summary.pop("group").values]
+        return summary
+
+    def age_summary(self, age_ranges: List[int]) -> pd.DataFrame:
+        """
+        Per step counts in every age range (long format, age_range column).
+
+        Parameters
+        ----------
+        age_ranges:
+            edges of the age ranges, people outside [age_ranges[0], age_ranges[-1])
+            are left out
+        """
+        age_ranges = np.asarray(age_ranges)
+        n_groups = len(age_ranges) - 1
+        person_groups = np.digitize(self.ages, age_ranges) - 1
+        person_groups[person_groups >= n_groups] = -1
+        group_sizes = np.bincount(
+            person_groups[person_groups >= 0], minlength=n_groups
+        )
+        labels = np.array(
+            [f"{low}-{high - 1}" for low, high in zip(age_ranges[:-1], age_ranges[1:])]
+        )
+        summary = self._summary(person_groups, group_sizes)
+        summary["age_range"] = labels[summary.pop("group").values]
+        return summary
+
+    def load_hospital_capacity(self) -> pd.DataFrame:
+        """
+        Number of patients and intensive care patients of every hospital per step,
+        indexed by time stamp (from the Logger file for runs without them in
+        results.h5).
+        """
+        with h5py.File(self.results_path, "r") as f:
+            if "hospitals" not in f:
+                return super().load_hospital_capacity()
+        hospitals = pd.concat(
+            [
+                pd.DataFrame(chunk)
+                for chunk in self._read_chunks(
+                    "hospitals", ["step", "id", "n_patients", "n_patients_icu"]
+                )
+            ]
+        )
+        hospitals.index = pd.Index(
+            self.dates[hospitals.pop("step").values], name="time_stamp"
+        )
+        return hospitals
+
+    def locations_per_day(
+        self,
+        start_date: Optional[datetime] = None,
+        end_date: Optional[datetime] = None,
+    ) -> pd.DataFrame:
+        """
+        Number of infections per day (rows) and infection location (columns).
+        """
+        per_chunk = []
+        for chunk in self._read_chunks("locations", ["step", "location", "counts"]):
+            frame = pd.DataFrame(
+                {
+                    "day": self.dates[chunk["step"]].floor("D"),
+                    "location": chunk["location"],
+                    "counts": chunk["counts"],
+                }
+            )
+            per_chunk.append(frame.groupby(["day", "location"]).counts.sum())
+        if not per_chunk:
+            return pd.DataFrame(index=pd.DatetimeIndex([], name="day"))
+        locations = (
+            pd.concat(per_chunk)
+            .groupby(level=[0, 1])
+            .sum()
+            .unstack("location", fill_value=0)
+        )
+        locations.columns = self.location_names[locations.columns.values]
+        return locations.loc[start_date:end_date]
+
+    def get_locations_infections(
+        self,
+        start_date: Optional[datetime] = None,
+        end_date: Optional[datetime] = None,
+    ) -> pd.DataFrame:
+        """
+        Total number and percentage of infections at every location.
+        """
+        counts = self.locations_per_day(start_date, end_date).sum()
+        locations_df = counts.to_frame("counts")
+        locations_df.index.name = "location"
+        locations_df["percentage_infections"] = 100 * counts / counts.sum()
+        return locations_df
+
+    def get_r(self) -> pd.DataFrame:
+        """
+        Daily reproduction number: mean number of secondary infections of the
+        people infected each day, counting those whose infection has ended.
+        """
+        first_step = np.full(self.n_people, -1, dtype=np.int64)
+        secondary_infections = np.zeros(self.n_steps)
+        ended_infections = np.zeros(self.n_steps)
+        for chunk in self._read_chunks(
+            "infected", ["step", "id", "symptoms", "n_secondary_infections"]
+        ):
+            idx = self.index_of(chunk["id"])
+            unseen = first_step[idx] < 0
+            # rows are in step order, so the first row of a person is their infection
+            new_idx, first_rows = np.unique(idx[unseen], return_index=True)
+            first_step[new_idx] = chunk["step"][unseen][first_rows]
+            ended = np.isin(chunk["symptoms"], ended_tags)
+            infection_steps = first_step[idx[ended]]
+            secondary_infections += np.bincount(
+                infection_steps,
+                weights=chunk["n_secondary_infections"][ended],
+                minlength=self.n_steps,
+            )
+            ended_infections += np.bincount(infection_steps, minlength=self.n_steps)
+        r_df = (
+            pd.DataFrame(
+                {
+                    "secondary_infections": secondary_infections,
+                    "ended_infections": ended_infections,
+                },
+                index=self.dates,
+            )
+            .resample("D")
+            .sum()
+        )
+        r_df["R"] = r_df.secondary_infections / r_df.ended_infections.replace(0, np.nan)
+        return r_df[["R"]]
+
+    def draw_symptom_trajectories(
+        self, window_length: int = 600, n_people: int = 10
+    ) -> List[pd.DataFrame]:
+        """
+        Symptoms and secondary infections over time of randomly drawn people
+        infected during the first window_length steps.
+        """
+        candidates = []
+        for chunk in self._read_chunks("infected", ["step", "id"]):
+            in_window = chunk["step"] < window_length
+            candidates.append(np.unique(chunk["id"][in_window]))
+            if not in_window[-1]:
+                break
+        if not candidates:
+            return []
+        candidates = np.unique(np.concatenate(candidates))
+        drawn_ids = np.random.choice(
+            candidates, size=min(n_people, len(candidates)), replace=False
+        )
+        trajectories = []
+        for chunk in self._read_chunks(
+            "infected", ["step", "id", "symptoms", "n_secondary_infections"]
+        ):
+            drawn = np.isin(chunk["id"], drawn_ids)
+            trajectories.append(
+                pd.DataFrame({column: values[drawn] for column, values in chunk.items()})
+            )
+        trajectories = pd.concat(trajectories)
+        trajectories.index = self.dates[trajectories.pop("step").values]
+        trajectories.index.name = "time_stamp"
+        return [
+            trajectory.drop(columns="id")
+            for _, trajectory in trajectories.groupby("id")
+        ]
@@ -0,0 +1,279 @@
+import logging
+from collections import defaultdict
+from pathlib import Path
+from queue import Queue
+from threading import Thread
+
+import h5py
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+date_format = "%Y-%m-%dT%H:%M:%S"
+
+
+class ResultsWriter:
+    """
+    Writes the per step results of the simulation (infected ids, symptoms and
+    secondary infections, and the infection locations) from a background thread,
+    so that disk I/O overlaps with the next time step.
+
+    The arrays of each step are handed over through a bounded queue and appended,
+    in long format, to chunked and compressed HDF5 datasets:
+
+    - steps/date: date of every step
+    - infected/{step, id, symptoms, n_secondary_infections}: one row per infected
+      person and step
+    - locations/{step, location, counts}: one row per infection location and step,
+      with the location names in locations/names
+    - hospitals/{step, id, n_patients, n_patients_icu}: one row per hospital and
+      step
+    - population/{id, age, sex, super_area}: written once, with the super area
+      names in super_areas/name
+
+    The file is opened (and truncated) by the writer thread when the first results
+    arrive, so that a writer can instead resume from a checkpointed state.
+    """
+
+    def __init__(
+        self,
+        save_path: str = "results",
+        file_name: str = "results.h5",
+        max_queue_size: int = 8,
+        chunk_size: int = 65536,
+        compression: str = "gzip",
+    ):
+        self.save_path = Path(save_path)
+        self.save_path.mkdir(parents=True, exist_ok=True)
+        self.file_path = self.save_path / file_name
+        self.chunk_size = chunk_size
+        self.compression = compression
+        self.location_names = []
+        self._location_codes = {}
+        self._locations = defaultdict(int)
+        self._step_dates = []
+        self._error = None
+        self.mode = "w"
+        self.opened = False
+        self.n_rows = defaultdict(int)
+        self.queue = Queue(maxsize=max_queue_size)
+        self.thread = Thread(target=self._write_loop, daemon=True)
+        self.thread.start()
+
+    def _step(self, date) -> int:
+        date = date.strftime(date_format)
+        if not self._step_dates or self._step_dates[-1] != date:
+            self._step_dates.append(date)
+            self._put("steps", {"date": np.array([date], dtype="S19")})
+        return len(self._step_dates) - 1
+
+    def _put(self, group: str, arrays: dict):
+        if self._error is not None:
+            raise self._error
+        self.queue.put((self._append, (group, arrays)))
+
+    def _append(self, f: h5py.File, group: str, arrays: dict):
+        for name, values in arrays.items():
+            path = f"{group}/{name}"
+            if path not in f:
+                f.create_dataset(
+                    path,
+                    shape=(0,),
+                    maxshape=(None,),
+                    chunks=(self.chunk_size,),
+                    compression=self.compression,
+                    dtype=values.dtype,
+                )
+            dataset = f[path]
+            n_rows = dataset.shape[0]
+            dataset.resize((n_rows + len(values),))
+            dataset[n_rows:] = values
+            self.n_rows[path] = n_rows + len(values)
+
+    def _resume(self, f: h5py.File, state: dict):
+        source_path = Path(state["file_path"])
+        if source_path.resolve() == self.file_path.resolve():
+            stale = []
+            f.visititems(
+                lambda path, item: stale.append(path)
+                if isinstance(item, h5py.Dataset) and path not in state["n_rows"]
+                else None
+            )
+            for path in stale:
+                del f[path]
+            for path, n_rows in state["n_rows"].items():
+                f[path].resize((n_rows,))
+                self.n_rows[path] = n_rows
+        elif source_path.exists():
+            with h5py.File(source_path, "r") as source:
+                for path, n_rows in state["n_rows"].items():
+                    group, name = path.rsplit("/", 1)
+                    for start in range(0, n_rows, self.chunk_size):
+                        stop = min(start + self.chunk_size, n_rows)
+                        self._append(f, group, {name: source[path][start:stop]})
+        if "steps/date" not in f:
+            self._append(
+                f, "steps", {"date": np.array(state["step_dates"], dtype="S19")}
+            )
+
+    def _write_loop(self):
+        f = None
+        try:
+            while True:
+                item = self.queue.get()
+                try:
+                    if item is None:
+                        return
+                    if self._error is None:
+                        if f is None:
+                            f = h5py.File(self.file_path, self.mode)
+                            self.opened = True
+                        function, args = item
+                        function(f, *args)
+                except Exception as error:
+                    logger.exception("Results writer failed")
+                    self._error = error
+                finally:
+                    self.queue.task_done()
+        finally:
+            if f is not None:
+                f.close()
+
+    def log_population(self, people_store):
+        super_area_names, super_area_codes = np.unique(
+            [person.area.super_area.name for person in people_store.people],
+            return_inverse=True,
+        )
+        self._put(
+            "population",
+            {
+                "id": people_store.ids.copy(),
+                "age": people_store.ages.copy(),
+                "sex": people_store.sexes.copy(),
+                "super_area": super_area_codes.astype(np.int32),
+            },
+        )
+        self._put("super_areas", {"name": super_area_names.astype("S")})
+
+    def log_infected(self, date, ids, symptoms, n_secondary_infections):
+        ids = np.array(ids, dtype=np.int64)
+        step = self._step(date)
+        self._put(
+            "infected",
+            {
+                "step": np.full(len(ids), step, dtype=np.int32),
+                "id": ids,
+                "symptoms": np.array(symptoms, dtype=np.int8),
+                "n_secondary_infections": np.array(
+                    n_secondary_infections, dtype=np.float32
+                ),
+            },
+        )
+
+    def accumulate_infection_location(self, location: str, n_infected: int):
+        self._locations[location] += n_infected
+
+    def log_infection_location(self, date):
+        step = self._step(date)
+        codes = []
+        for location in self._locations:
+            if location not in self._location_codes:
+                self._location_codes[location] = len(self.location_names)
+                self.location_names.append(location)
+            codes.append(self._location_codes[location])
+        self._put(
+            "locations",
+            {
+                "step": np.full(len(codes), step, dtype=np.int32),
+                "location": np.array(codes, dtype=np.int16),
+                "counts": np.array(list(self._locations.values()), dtype=np.int32),
+            },
+        )
+        self._locations = defaultdict(int)
+
+    def log_hospital_capacity(self, date, hospitals):
+        """
+        Number of patients and intensive care patients of every hospital.
+        """
+        step = self._step(date)
+        members = hospitals.members
+        self._put(
+            "hospitals",
+            {
+                "step": np.full(len(members), step, dtype=np.int32),
+                "id": np.array([hospital.id for hospital in members], dtype=np.int32),
+                "n_patients": np.array(
+                    [
+                        len(hospital.subgroups[hospital.SubgroupType.patients].people)
+                        for hospital in members
+                    ],
+                    dtype=np.int32,
+                ),
+                "n_patients_icu": np.array(
+                    [
+                        len(
+                            hospital.subgroups[
+                                hospital.SubgroupType.icu_patients
+                            ].people
+                        )
+                        for hospital in members
+                    ],
+                    dtype=np.int32,
+                ),
+            },
+        )
+
+    def state(self) -> dict:
+        """
+        Number of rows written to every dataset, step dates and location names,
+        everything needed to resume writing from this point.
+        """
+        self.flush()
+        return {
+            "file_path": str(self.file_path),
+            "n_rows": dict(self.n_rows),
+            "step_dates": list(self._step_dates),
+            "location_names": list(self.location_names),
+        }
+
+    def resume(self, state: dict):
+        """
+        Continues the results of a checkpointed run: truncates the file back to the
+        checkpoint if it is the one the state was taken from, otherwise copies the
+        results up to the checkpoint from it. Must be called before anything is
+        written.
+        """
+        if self.opened or self._step_dates:
+            raise RuntimeError("Results writer can only resume before writing")
+        self.mode = "a"
+        self._step_dates = list(state["step_dates"])
+        self.location_names = list(state["location_names"])
+        self._location_codes = {
+            location: code for code, location in enumerate(self.location_names)
+        }
+        self.queue.put((self._resume, (state,)))
+
+    def flush(self):
+        """
+        Blocks until everything queued so far is written.
+        """
+        self.queue.join()
+        if self._error is not None:
+            raise self._error
+
+    def close(self):
+        """
+        Writes everything still queued, stops the writer thread and stores the
+        location names.
+        """
+        self.queue.put(None)
+        self.thread.join()
+        if self._error is not None:
+            raise self._error
+        with h5py.File(self.file_path, "a" if self.opened else self.mode) as f:
+            if "locations/names" in f:
+                del f["locations/names"]
+            f.create_dataset(
+                "locations/names",
+                data=np.array(self.location_names, dtype="S"),
+            )
@@ -1,32 +1,63 @@
 import logging
-from array import array
+import pickle
+import random
+import shutil
 from itertools import chain
-from typing import Optional
+from pathlib import Path
+from typing import List, Optional
+import numba as nb
 import numpy as np
 
 import yaml
 
 from june import paths
 from june.activity import ActivityManager, activity_hierarchy
+from june.activity.batched_activity_manager import (
+    BatchedActivityManager,
+    TrackedActivityManager,
+)
 from june.demography import Person, Activities
+from june.demography.people_store import PeopleStore, not_infected
 from june.exc import SimulatorError
 from june.groups.leisure import Leisure
+from june.groups.leisure.venue_candidates import prepare_venue_candidates
 from june.infection.symptom_tag import SymptomTag
 from june.infection import InfectionSelector
 from june.infection_seed import InfectionSeed
+from june.infection.transition_scheduler import TransitionScheduler
+from june.infected_group_index import InfectedGroupIndex
 from june.interaction import Interaction, InteractiveGroup
+from june.interaction.interaction import InteractiveGroupBatch
+from june.interaction.parallel_interaction import ParallelInteraction
 from june.logger.logger import Logger
-from june.policy import Policies, MedicalCarePolicies, InteractionPolicies
+from june.logger.results_writer import ResultsWriter
+from june.policy import Policies
+from june.policy.policy_plan import PolicyPlans
 from june.time import Timer
 from june.world import World
 
 default_config_filename = paths.configs_path / "config_example.yaml"
 
+# visits place people in the groups of another group type
+visits_to_group_types = {
+    "household_visits": "households",
+    "care_home_visits": "care_homes",
+}
+
 logger = logging.getLogger(__name__)
 
 
+@nb.njit
+def seed_numba(seed: int):
+    """
+    Seeds the random generator of jitted code (e.g. random_choice_numba in the
+    per person leisure), which is separate from np.random.
+    """
+    np.random.seed(seed)
+
+
 class Simulator:
-    ActivityManager = ActivityManager
+    ActivityManager = TrackedActivityManager
 
     def __init__(
         self,
@@ -38,6 +69,13 @@ class Simulator:
         infection_seed: Optional["InfectionSeed"] = None,
         save_path: str = "results",
         light_logger: bool = False,
+        index_infected_groups: bool = True,
+        seed: Optional[int] = None,
+        n_processes: int = 1,
+        event_driven_health: bool = True,
+        async_writer: bool = False,
+        checkpoint_interval: Optional[float] = None,
+        checkpoint_path: Optional[str] = None,
     ):
         """
         Class to run an epidemic spread simulation on the world
@@ -48,6 +86,28 @@ class Simulator:
             instance of World class
         save_path:
             path to save logger results
+        index_infected_groups:
+            whether to only time step the groups holding an infector, instead of
+            scanning every group of every active group type
+        seed:
+            seed of the random generator used to draw infections, a new generator
+            is seeded with (seed, step number) at every time step
+        n_processes:
+            number of worker processes the transmission of large group types is
+            split over (1 runs everything in this process)
+        event_driven_health:
+            whether to keep the next symptom transition of every infected person in a
+            priority queue and only update the health status of those due in a step,
+            instead of updating every infected person every step
+        async_writer:
+            whether to write the per step infected and infection location results
+            from a background thread into save_path/results.h5, instead of through
+            the logger inside every time step
+        checkpoint_interval:
+            if given, save a checkpoint every checkpoint_interval days of simulated
+            time (see save_checkpoint)
+        checkpoint_path:
+            directory of the checkpoints, save_path/checkpoints by default
         """
         self.activity_manager = activity_manager
         self.world = world
@@ -56,11 +116,41 @@ class Simulator:
         self.infection_seed = infection_seed
         self.light_logger = light_logger
         self.timer = timer
+        self.seed = seed
+        self.n_timesteps = 0
+        self.checkpoint_interval = checkpoint_interval
+        if checkpoint_path is None and save_path is not None:
+            checkpoint_path = f"{save_path}/checkpoints"
+        self.checkpoint_path = checkpoint_path
+        self.restored = False
+        self.logger_restored = False
+        self.policy_plans = PolicyPlans(self.activity_manager.policies)
+        self.activity_manager.policy_plans = self.policy_plans
+        if n_processes > 1:
+            self.parallel_interaction = ParallelInteraction(interaction, n_processes)
+        else:
+            self.parallel_interaction = None
+        # the people store needs everyone's residence
+        self.load_group_types(["households", "care_homes"])
         self.sort_people_world()
+        if event_driven_health:
+            self.transition_scheduler = TransitionScheduler(self.people_store)
+        else:
+            self.transition_scheduler = None
+        if index_infected_groups:
+            self.infected_group_index = InfectedGroupIndex()
+        else:
+            self.infected_group_index = None
         if not self.world.box_mode and save_path is not None:
             self.logger = Logger(save_path=save_path)
         else:
             self.logger = None
+        if async_writer and self.logger is not None:
+            self.results_writer = ResultsWriter(save_path=save_path)
+            self.step_logger = self.results_writer
+        else:
+            self.results_writer = None
+            self.step_logger = self.logger
 
     @classmethod
     def from_file(
@@ -73,6 +163,10 @@ class Simulator:
         leisure: Optional[Leisure] = None,
         config_filename: str = default_config_filename,
         save_path: str = "results",
+        seed: Optional[int] = None,
+        n_processes: int = 1,
+        batched_activities: bool = False,
+        async_writer: bool = False,
     ) -> "Simulator":
 
         """
@@ -80,6 +174,13 @@ class Simulator:
 
         Parameters
         ----------
+        async_writer
+            write the per step results to results.h5 from a background thread
+        batched_activities
+            use the BatchedActivityManager, which decides leisure for the whole
+            population in array operations
+        n_processes
+        seed
         save_path
         leisure
         infection_seed
@@ -119,7 +220,15 @@ class Simulator:
             weekend_activities=time_config["step_activities"]["weekend"],
         )
 
-        activity_manager = cls.ActivityManager(
+        if leisure is not None and not world.box_mode:
+            prepare_venue_candidates(
+                leisure, world, assign_households=not batched_activities
+            )
+        if batched_activities:
+            activity_manager_class = BatchedActivityManager
+        else:
+            activity_manager_class = cls.ActivityManager
+        activity_manager = activity_manager_class(
             world=world,
             all_activities=all_activities,
             activity_to_groups=activity_to_groups,
@@ -136,15 +245,31 @@ class Simulator:
             infection_seed=infection_seed,
             save_path=save_path,
             interaction=interaction,
+            seed=seed,
+            n_processes=n_processes,
+            async_writer=async_writer,
         )
 
     def sort_people_world(self):
         """
-        Sorts world population by id so it is easier to find them later.
+        Sorts world population by id so it is easier to find them later,
+        and builds the columnar store of their per step state.
         """
         people_ids = np.array([person.id for person in self.world.people])
         ids_sorted_idx = np.argsort(people_ids)
         self.world.people.people = np.array(self.world.people)[ids_sorted_idx]
+        self.people_store = PeopleStore(self.world.people.people)
+        self.activity_manager.people_store = self.people_store
+
+    def load_group_types(self, group_names: List[str]):
+        """
+        Loads the given group types of a lazily loaded world (see LazyWorld), which
+        builds each group type, and links people to its subgroups, on first access.
+        People are placed from their subgroups, so the group types of a step's
+        activities are loaded before the step; types no step uses are never loaded.
+        """
+        for group_name in group_names:
+            getattr(self.world, visits_to_group_types.get(group_name, group_name), None)
 
     def clear_world(self):
         """
@@ -152,9 +277,13 @@ class Simulator:
         to False.
 
         """
+        is_loaded = getattr(self.world, "is_loaded", None)
         for group_name in self.activity_manager.all_groups:
             if group_name in ["care_home_visits", "household_visits"]:
                 continue
+            if is_loaded is not None and not is_loaded(group_name):
+                # nobody is in the groups of a type that is not loaded yet
+                continue
             grouptype = getattr(self.world, group_name)
             if grouptype is not None:
                 for group in grouptype.members:
@@ -163,6 +292,50 @@ class Simulator:
         for person in self.world.people.members:
             person.busy = False
             person.subgroups.leisure = None
+        if isinstance(self.activity_manager, TrackedActivityManager):
+            self.activity_manager.clear_placements()
+
+    def clear_active_groups(self, active_groups: List[str]):
+        """
+        Removes everyone from the subgroups they were placed in during the last time
+        step, resetting the busy and leisure attributes of only the people placed.
+        The subgroups are those recorded by the activity manager at placement; if it
+        does not record them (or missed one), every group of the group types used in
+        the last time step is cleared instead. Either way, groups nobody was placed
+        in and people that were not placed (e.g. the dead) are left untouched.
+
+        Parameters
+        ----------
+        active_groups:
+            names of the group types active in the last time step
+        """
+        activity_manager = self.activity_manager
+        if isinstance(activity_manager, TrackedActivityManager):
+            if activity_manager.placements_complete:
+                for subgroup in activity_manager.placed_subgroups.values():
+                    for person in subgroup.people:
+                        person.busy = False
+                        person.subgroups.leisure = None
+                    subgroup.clear()
+                activity_manager.clear_placements()
+                return
+            activity_manager.clear_placements()
+        group_names = {
+            visits_to_group_types.get(group_name, group_name)
+            for group_name in active_groups
+        }
+        for group_name in group_names:
+            grouptype = getattr(self.world, group_name)
+            if grouptype is None:
+                continue
+            for group in grouptype.members:
+                for subgroup in group.subgroups:
+                    if not subgroup.people:
+                        continue
+                    for person in subgroup.people:
+                        person.busy = False
+                        person.subgroups.leisure = None
+                    subgroup.clear()
 
     @staticmethod
     def check_inputs(time_config: dict):
@@ -199,13 +372,20 @@ class Simulator:
             person to send to cemetery
         """
         person.dead = True
+        if self.infected_group_index is not None:
+            self.infected_group_index.remove_infected(person)
+        if self.transition_scheduler is not None:
+            self.transition_scheduler.remove(person)
         cemetery = self.world.cemeteries.get_nearest(person)
         cemetery.add(person)
+        person.health_information.number_of_infected = float(
+            self.people_store.number_of_infected[self.people_store.index_of(person.id)]
+        )
         person.health_information.set_dead(time)
         person.subgroups = Activities(None, None, None, None, None, None, None)
+        self.people_store.set_dead(self.people_store.index_of(person.id))
 
-    @staticmethod
-    def recover(person: "Person", time: float):
+    def recover(self, person: "Person", time: float):
         """
         When someone recovers, erase the health information they carry and change their susceptibility.
 
@@ -221,12 +401,19 @@ class Simulator:
         person.health_information.set_recovered(time)
         person.susceptibility = 0.0
         person.health_information = None
+        self.people_store.susceptibility[self.people_store.index_of(person.id)] = 0.0
+        if self.infected_group_index is not None:
+            self.infected_group_index.remove_infected(person)
+        if self.transition_scheduler is not None:
+            self.transition_scheduler.remove(person)
 
     def update_health_status(self, time: float, duration: float):
         """
         Update symptoms and health status of infected people.
         Send them to hospital if necessary, or bury them if they
-        have died.
+        have died. With the transition scheduler, only the people whose
+        symptoms change in this time step are updated, and the logged
+        snapshot of all the infected comes from the people store.
 
         Parameters
         ----------
@@ -235,13 +422,20 @@ class Simulator:
         duration:
             duration of time step
         """
-        ids = array('l', [])
-        symptoms = array('l', [])
-        n_secondary_infections = array('f', [])
-        medical_care_policies = MedicalCarePolicies.get_active_policies(
-            policies=self.activity_manager.policies, date=self.timer.date
-        )
-        for person in self.world.people.infected:
+        store = self.people_store
+        medical_care_policies = self.policy_plans.plan_for(
+            self.timer.date
+        ).medical_care_policies
+        if self.transition_scheduler is None:
+            people_to_update = self.world.people.infected
+        else:
+            # on the clock of update_health_status, which evaluates at time + duration
+            self.transition_scheduler.update_transmission_probabilities(
+                time + duration
+            )
+            people_to_update = self.transition_scheduler.pop_due(time + duration)
+        ended_infections = []
+        for person in people_to_update:
             health_information = person.health_information
             previous_tag = health_information.tag
             health_information.update_health_status(time, duration)
@@ -250,19 +444,32 @@ class Simulator:
                 and health_information.tag == SymptomTag.mild
             ):
                 person.residence.group.quarantine_starting_date = time
-            ids.append(person.id)
-            symptoms.append(person.health_information.tag.value)
-            n_secondary_infections.append(person.health_information.number_of_infected)
+                store.quarantine_residence(person.residence.group)
+            idx = store.index_of(person.id)
+            store.symptom_tag[idx] = health_information.tag.value
+            store.transmission_probability[
+                idx
+            ] = health_information.infection.transmission.probability
             # Take actions on new symptoms
             medical_care_policies.apply(person=person, medical_facilities=self.world.hospitals)
             if health_information.recovered:
                 self.recover(person, time)
+                ended_infections.append(idx)
             elif health_information.is_dead:
                 self.bury_the_dead(person, time)
-        if self.logger is not None:
-            self.logger.log_infected(
-                self.timer.date, ids, symptoms, n_secondary_infections
+                ended_infections.append(idx)
+            elif self.transition_scheduler is not None:
+                # the stage reached at time + duration is applied, schedule the next
+                self.transition_scheduler.schedule(person, time + duration)
+        if self.step_logger is not None:
+            infected_idx = store.infected_idx
+            self.step_logger.log_infected(
+                self.timer.date,
+                store.ids[infected_idx],
+                store.symptom_tag[infected_idx],
+                store.number_of_infected[infected_idx],
             )
+        store.symptom_tag[ended_infections] = not_infected
 
     def do_timestep(self):
         """
@@ -270,9 +477,9 @@ class Simulator:
 
         """
         if self.activity_manager.policies is not None:
-            interaction_policies = InteractionPolicies.get_active_policies(
-                policies=self.activity_manager.policies, date=self.timer.date
-            )
+            interaction_policies = self.policy_plans.plan_for(
+                self.timer.date
+            ).interaction_policies
             interaction_policies.apply(
                 date=self.timer.date, interaction=self.interaction
             )
@@ -280,7 +487,23 @@ class Simulator:
         if not activities or len(activities) == 0:
             logger.info("==== do_timestep(): no active groups found. ====")
             return
+        if isinstance(self.activity_manager, BatchedActivityManager):
+            self.activity_manager.seed_step(
+                self.seed,
+                self.n_timesteps,
+                counter_based=self.interaction.sampling == "counter",
+            )
+        self.load_group_types(self.activity_manager.active_groups)
         self.activity_manager.do_timestep()
+        self.interaction.seed_step(self.seed, self.n_timesteps)
+        if self.seed is not None:
+            # numba's generator state cannot be saved, so it is reseeded every step
+            seed_numba(
+                np.random.SeedSequence([self.seed, self.n_timesteps, 2]).generate_state(
+                    1
+                )[0]
+            )
+        self.n_timesteps += 1
 
         print("XX")
         active_groups = self.activity_manager.active_groups
@@ -294,42 +517,71 @@ class Simulator:
 
         for cemetery in self.world.cemeteries.members:
             n_people += len(cemetery.people)
+        if self.infected_group_index is not None:
+            n_infected = len(self.infected_group_index)
+            placed_in = None
+            if (
+                isinstance(self.activity_manager, TrackedActivityManager)
+                and self.activity_manager.placements_complete
+            ):
+                placed_in = self.activity_manager.placed_in
+            self.infected_group_index.place_infected(
+                self.activity_manager.apply_activity_hierarchy(activities), placed_in
+            )
+        else:
+            n_infected = len(self.world.people.infected)
         logger.info(
             f"Date = {self.timer.date}, "
             f"number of deaths =  {n_people}, "
-            f"number of infected = {len(self.world.people.infected)}"
+            f"number of infected = {n_infected}"
         )
-        infected_ids = array('l', [])
+        infected_ids = [np.array([], dtype=np.int_)]
+        blame_ids = [np.array([], dtype=np.int_)]
+        blame = [np.array([], dtype=np.float64)]
         first_person_id = self.world.people[0].id
         for group_type in group_instances:
-            for group in group_type.members:
+            interactive_groups = []
+            for group in self.groups_to_timestep(group_type):
                 int_group = InteractiveGroup(group)
                 n_people += int_group.size
                 if int_group.must_timestep:
-                    new_infected_ids = self.interaction.time_step_for_group(
-                        self.timer.duration, int_group
-                    )
-                    if new_infected_ids:
-                        n_infected = len(new_infected_ids)
-                        if self.logger is not None:
-                            self.logger.accumulate_infection_location(
-                                group.spec, n_infected
-                            )
-                        # assign blame of infections
-                        tprob_norm = sum(int_group.transmission_probabilities)
-                        for infector_id in list(chain(*int_group.infector_ids)):
-                            infector = self.world.people[infector_id - first_person_id]
-                            assert infector.id == infector_id
-                            infector.health_information.number_of_infected += (
-                                n_infected
-                                * infector.health_information.infection.transmission.probability
-                                / tprob_norm
-                            )
-                    if new_infected_ids:
-                        infected_ids += new_infected_ids
-
-        people_to_infect = self.world.people[infected_ids-first_person_id]
-        if n_people != self.world.people.people.size:
+                    interactive_groups.append(int_group)
+            if not interactive_groups:
+                continue
+            batch = InteractiveGroupBatch(interactive_groups)
+            if self.parallel_interaction is not None:
+                time_step_for_group_type = self.parallel_interaction.time_step_for_group_type
+            else:
+                time_step_for_group_type = self.interaction.time_step_for_group_type
+            new_infected_ids, n_infected_per_group = time_step_for_group_type(
+                self.timer.duration, batch
+            )
+            if len(new_infected_ids) == 0:
+                continue
+            if self.step_logger is not None:
+                self.step_logger.accumulate_infection_location(
+                    batch.spec, len(new_infected_ids)
+                )
+            # assign blame of infections
+            infector_probabilities = self.people_store.transmission_probability[
+                self.people_store.index_of(batch.infector_ids)
+            ]
+            blame_ids.append(batch.infector_ids)
+            blame.append(batch.blame(n_infected_per_group, infector_probabilities))
+            infected_ids.append(new_infected_ids)
+
+        infected_ids = np.concatenate(infected_ids)
+        blame_ids = np.concatenate(blame_ids)
+        blame = np.concatenate(blame)
+        # the infection selector draws from np.random person by person, so infect in
+        # id order whatever order the groups (or workers) produced the ids in
+        infected_ids = np.sort(infected_ids)
+        self.people_store.add_blame(blame_ids, blame)
+        people_to_infect = self.world.people[infected_ids - first_person_id]
+        if (
+            self.infected_group_index is None
+            and n_people != self.world.people.people.size
+        ):
             raise SimulatorError(
                 f"Number of people active {n_people} does not match "
                 f"the total people number {len(self.world.people.members)}"
@@ -339,12 +591,206 @@ class Simulator:
             for i, person in enumerate(people_to_infect):
                 assert infected_ids[i] == person.id
                 self.infection_selector.infect_person_at_time(person, self.timer.now)
+                self.register_infected(person)
         self.update_health_status(time=self.timer.now, duration=self.timer.duration)
         if self.logger:
-            self.logger.log_infection_location(self.timer.date)
+            self.step_logger.log_infection_location(self.timer.date)
             if self.world.hospitals is not None:
-                self.logger.log_hospital_capacity(self.timer.date, self.world.hospitals)
-        self.clear_world()
+                self.step_logger.log_hospital_capacity(
+                    self.timer.date, self.world.hospitals
+                )
+        if self.infected_group_index is not None:
+            self.infected_group_index.clear_placements()
+        self.clear_active_groups(active_groups)
+
+    def register_infected(self, person: "Person"):
+        """
+        Keeps track of a newly infected person in the infected group index and the
+        people store.
+        """
+        if self.infected_group_index is not None:
+            self.infected_group_index.add_infected(person)
+        if self.transition_scheduler is not None:
+            self.transition_scheduler.schedule(person, self.timer.now)
+        idx = self.people_store.index_of(person.id)
+        self.people_store.susceptibility[idx] = person.susceptibility
+        self.people_store.symptom_tag[idx] = person.health_information.tag.value
+        self.people_store.transmission_probability[
+            idx
+        ] = person.health_information.infection.transmission.probability
+
+    def register_seeded_infections(self):
+        """
+        Registers everyone infected outside of the simulator (e.g. by the infection seed).
+        """
+        for person in self.world.people.infected:
+            self.register_infected(person)
+
+    def groups_to_timestep(self, group_type):
+        """
+        Groups of group_type that need to be looked at in this time step: all of them,
+        or only those holding an infector when the infected group index is on.
+        """
+        if self.infected_group_index is None:
+            return group_type.members
+        if not group_type.members:
+            return []
+        return self.infected_group_index.groups_for_spec(group_type.members[0].spec)
+
+    def save_checkpoint(self, file_path: str):
+        """
+        Saves everything needed to continue the run from the end of the current time
+        step: the timer, the per person health and infection state (people store
+        columns plus the health information of the infected and the dead), the
+        cemeteries, hospital and quarantine state, the interaction parameters, the
+        random states and the results writer offsets. The logger file is copied
+        next to the checkpoint (file_path.logger.hdf5), since the Logger of the
+        simulator that restores it starts a new file.
+
+        Continuations are bit identical if the simulator was given a seed (the
+        generator of jitted code is then reseeded from it every step).
+        """
+        store = self.people_store
+        people = self.world.people.people
+        if self.infected_group_index is not None:
+            infected_ids = list(self.infected_group_index.infected)
+        else:
+            infected_ids = [person.id for person in self.world.people.infected]
+        dead_ids = store.ids[store.dead]
+        health_ids = np.concatenate(
+            [np.array(infected_ids, dtype=np.int64), dead_ids]
+        )
+        health_information = [
+            people[idx].health_information for idx in store.index_of(health_ids)
+        ]
+        medical_facilities = []
+        if self.world.hospitals is not None:
+            hospital_to_idx = {
+                id(hospital): idx
+                for idx, hospital in enumerate(self.world.hospitals.members)
+            }
+            for person_id in infected_ids:
+                subgroup = people[store.index_of(person_id)].subgroups.medical_facility
+                if subgroup is not None:
+                    medical_facilities.append(
+                        (
+                            person_id,
+                            hospital_to_idx[id(subgroup.group)],
+                            subgroup.subgroup_type,
+                        )
+                    )
+        quarantines = []
+        if self.world.households is not None:
+            quarantines = [
+                (idx, household.quarantine_starting_date)
+                for idx, household in enumerate(self.world.households.members)
+                if getattr(household, "quarantine_starting_date", None) is not None
+            ]
+        state = {
+            "timer": self.timer,
+            "n_timesteps": self.n_timesteps,
+            "seed": self.seed,
+            "store": {
+                column: getattr(store, column).copy()
+                for column in (
+                    "dead",
+                    "symptom_tag",
+                    "transmission_probability",
+                    "number_of_infected",
+                )
+            },
+            # from the people, which are the reference for the susceptibility
+            "susceptibility": np.fromiter(
+                (person.susceptibility for person in people), np.float32, len(people)
+            ),
+            "infected_ids": infected_ids,
+            "health_ids": health_ids,
+            "health_information": health_information,
+            "cemeteries": [
+                np.array([person.id for person in cemetery.people], dtype=np.int64)
+                for cemetery in self.world.cemeteries.members
+            ],
+            "medical_facilities": medical_facilities,
+            "quarantines": quarantines,
+            "beta": dict(self.interaction.beta),
+            "alpha_physical": self.interaction.alpha_physical,
+            "numpy_random_state": np.random.get_state(),
+            "random_state": random.getstate(),
+            "results_writer": (
+                self.results_writer.state() if self.results_writer is not None else None
+            ),
+        }
+        Path(file_path).parent.mkdir(parents=True, exist_ok=True)
+        state["logger_file"] = None
+        if self.logger is not None and Path(self.logger.file_path).exists():
+            state["logger_file"] = f"{file_path}.logger.hdf5"
+            shutil.copyfile(self.logger.file_path, state["logger_file"])
+        with open(file_path, "wb") as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def restore_checkpoint(self, file_path: str):
+        """
+        Restores the state saved by save_checkpoint, on a simulator built on the
+        same world file and configuration (policies, save_path, etc. may differ, to
+        branch scenarios from a common checkpoint). run() then continues from the
+        step after the checkpoint.
+        """
+        with open(file_path, "rb") as f:
+            state = pickle.load(f)
+        store = self.people_store
+        people = self.world.people.people
+        self.timer = state["timer"]
+        self.activity_manager.timer = self.timer
+        self.n_timesteps = state["n_timesteps"]
+        self.seed = state["seed"]
+        susceptibility = state["susceptibility"]
+        current = np.fromiter(
+            (person.susceptibility for person in people), np.float32, len(people)
+        )
+        for idx in np.flatnonzero(susceptibility != current):
+            people[idx].susceptibility = float(susceptibility[idx])
+        store.susceptibility[:] = susceptibility
+        for column, values in state["store"].items():
+            getattr(store, column)[:] = values
+        # people infected by the seed when the world was built may have recovered
+        for person in self.world.people.infected:
+            person.health_information = None
+        for person_id, health_information in zip(
+            state["health_ids"], state["health_information"]
+        ):
+            people[store.index_of(person_id)].health_information = health_information
+        for idx in np.flatnonzero(store.dead):
+            person = people[idx]
+            person.dead = True
+            person.subgroups = Activities(None, None, None, None, None, None, None)
+            store.set_dead(idx)
+        for cemetery, ids in zip(self.world.cemeteries.members, state["cemeteries"]):
+            for idx in store.index_of(ids):
+                cemetery.add(people[idx])
+        for person_id, hospital_idx, subgroup_type in state["medical_facilities"]:
+            idx = store.index_of(person_id)
+            subgroup = self.world.hospitals.members[hospital_idx][subgroup_type]
+            people[idx].subgroups.medical_facility = subgroup
+        for household_idx, quarantine_starting_date in state["quarantines"]:
+            household = self.world.households.members[household_idx]
+            household.quarantine_starting_date = quarantine_starting_date
+            store.quarantine_residence(household)
+        for person_id in state["infected_ids"]:
+            person = people[store.index_of(person_id)]
+            if self.infected_group_index is not None:
+                self.infected_group_index.add_infected(person)
+            if self.transition_scheduler is not None:
+                self.transition_scheduler.schedule(person, self.timer.now)
+        self.interaction.beta = state["beta"]
+        self.interaction.alpha_physical = state["alpha_physical"]
+        np.random.set_state(state["numpy_random_state"])
+        random.setstate(state["random_state"])
+        if self.results_writer is not None and state["results_writer"] is not None:
+            self.results_writer.resume(state["results_writer"])
+        if self.logger is not None and state.get("logger_file") is not None:
+            shutil.copyfile(state["logger_file"], self.logger.file_path)
+            self.logger_restored = True
+        self.restored = True
 
     def run(self):
         """
@@ -357,7 +803,10 @@ class Simulator:
             f"starting the loop ..., at {self.timer.day} days, to run for {self.timer.total_days} days"
         )
         self.clear_world()
-        if self.logger:
+        if not self.restored:
+            self.register_seeded_infections()
+        if self.logger and not self.logger_restored:
+            # a restored logger file already has these
             self.logger.log_population(
                 self.world.people, light_logger=self.light_logger
             )
@@ -371,11 +820,51 @@ class Simulator:
 
             if self.world.hospitals is not None:
                 self.logger.log_hospital_characteristics(self.world.hospitals)
+        if self.results_writer is not None and not self.restored:
+            self.results_writer.log_population(self.people_store)
+
+        next_checkpoint = self.timer.now
+        if self.checkpoint_interval is not None:
+            next_checkpoint += self.checkpoint_interval
+        try:
+            for time in self.timer:
+                if time > self.timer.final_date:
+                    break
+                if self.infection_seed:
+                    if (
+                        self.infection_seed.max_date
+                        >= time
+                        >= self.infection_seed.min_date
+                    ):
+                        self.infection_seed.unleash_virus_per_region(time)
+                        self.register_seeded_infections()
+                self.do_timestep()
+                if (
+                    self.checkpoint_interval is not None
+                    and self.timer.now + self.timer.duration >= next_checkpoint
+                ):
+                    self.save_checkpoint(
+                        f"{self.checkpoint_path}/checkpoint_{self.n_timesteps:06d}.pkl"
+                    )
+                    next_checkpoint += self.checkpoint_interval
+        finally:
+            self.close()
 
-        for time in self.timer:
-            if time > self.timer.final_date:
-                break
-            if self.infection_seed:
-                if self.infection_seed.max_date >= time >= self.infection_seed.min_date:
-                    self.infection_seed.unleash_virus_per_region(time)
-            self.do_timestep()
+    def close(self):
+        """
+        Stops the interaction worker processes and closes the results writer. run()
+        always calls it, also when it fails; a simulator that is never run has to be
+        closed explicitly, or used as a context manager.
+        """
+        if self.parallel_interaction is not None:
+            self.parallel_interaction.close()
+            self.parallel_interaction = None
+        if self.results_writer is not None:
+            results_writer, self.results_writer = self.results_writer, None
+            results_writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
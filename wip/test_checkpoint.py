@@ -0,0 +1,85 @@
+import numpy as np
+import pytest
+import yaml
+
+from june.demography.geography import Geography
+from june.groups import CareHomes, Cemeteries, Companies, Hospitals, Schools
+from june.infection.infection import InfectionSelector
+from june.infection_seed import InfectionSeed
+from june.interaction import Interaction
+from june.simulator import Simulator, default_config_filename
+from june.world import generate_world_from_geography, generate_world_from_hdf5
+
+super_areas = ["E02003282", "E02001720"]
+checked_columns = (
+    "susceptibility",
+    "dead",
+    "symptom_tag",
+    "transmission_probability",
+    "number_of_infected",
+)
+
+
+@pytest.fixture(name="world_file", scope="module")
+def make_world_file(tmp_path_factory):
+    geography = Geography.from_file({"super_area": super_areas})
+    geography.hospitals = Hospitals.for_geography(geography)
+    geography.schools = Schools.for_geography(geography)
+    geography.companies = Companies.for_geography(geography)
+    geography.care_homes = CareHomes.for_geography(geography)
+    world = generate_world_from_geography(geography, include_households=True)
+    world_file = str(tmp_path_factory.mktemp("world") / "world.hdf5")
+    world.to_hdf5(world_file)
+    return world_file
+
+
+@pytest.fixture(name="config_file", scope="module")
+def make_config_file(tmp_path_factory):
+    with open(default_config_filename) as f:
+        config = yaml.safe_load(f)
+    config["time"]["total_days"] = 6
+    config_file = tmp_path_factory.mktemp("config") / "config.yaml"
+    with open(config_file, "w") as f:
+        yaml.dump(config, f)
+    return config_file
+
+
+def make_simulator(world_file, config_file, save_path):
+    np.random.seed(0)
+    world = generate_world_from_hdf5(world_file)
+    world.cemeteries = Cemeteries()
+    selector = InfectionSelector.from_file()
+    InfectionSeed(world.super_areas, selector).unleash_virus(20)
+    return Simulator.from_file(
+        world,
+        Interaction.from_file(),
+        selector,
+        config_filename=config_file,
+        save_path=str(save_path),
+        seed=0,
+    )
+
+
+def test__checkpoint_continuation_matches_uninterrupted_run(
+    world_file, config_file, tmp_path
+):
+    uninterrupted = make_simulator(world_file, config_file, tmp_path / "full")
+    uninterrupted.checkpoint_interval = 2
+    uninterrupted.checkpoint_path = str(tmp_path / "checkpoints")
+    uninterrupted.run()
+    checkpoints = sorted((tmp_path / "checkpoints").glob("checkpoint_*.pkl"))
+    assert checkpoints
+
+    continued = make_simulator(world_file, config_file, tmp_path / "continued")
+    continued.restore_checkpoint(str(checkpoints[0]))
+    continued.run()
+
+    assert continued.n_timesteps == uninterrupted.n_timesteps
+    for column in checked_columns:
+        np.testing.assert_array_equal(
+            getattr(continued.people_store, column),
+            getattr(uninterrupted.people_store, column),
+        )
+    people = zip(continued.world.people.people, uninterrupted.world.people.people)
+    for continued_person, uninterrupted_person in people:
+        assert continued_person.susceptibility == uninterrupted_person.susceptibility
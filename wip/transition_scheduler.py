@@ -0,0 +1,114 @@
+import heapq
+from typing import Dict, List
+
+import numpy as np
+
+from june.demography import Person
+from june.infection.transmission import TransmissionConstant, TransmissionGamma
+
+
+class TransitionScheduler:
+    """
+    Keeps the time of the next symptom transition of every infected person in a
+    heap, so that only the people whose symptoms change during a time step need
+    their health status updated.
+
+    Entries made stale by rescheduling a person are skipped when popped.
+
+    Transmission probabilities change every step whatever the symptoms do; those of
+    gamma transmissions are computed from the parameters kept in the people store,
+    all at once, and only other time dependent transmissions are updated one by one.
+    """
+
+    def __init__(self, people_store):
+        self.people_store = people_store
+        self.infected: Dict[int, Person] = {}
+        self.next_transition: Dict[int, float] = {}
+        self.heap = []
+        # store index -> transmission, of the infected with a gamma transmission
+        self.gamma_transmissions = {}
+        # other time dependent transmissions, by person id
+        self.other_transmissions: Dict[int, Person] = {}
+
+    def __len__(self):
+        return len(self.infected)
+
+    @staticmethod
+    def next_transition_time(person: Person, time: float) -> float:
+        """
+        Time of the first stage of the person's symptoms trajectory that starts
+        after time (infinity if there is none left).
+        """
+        infection = person.health_information.infection
+        time_from_infection = time - infection.start_time
+        for stage_time, _ in infection.symptoms.trajectory:
+            if stage_time > time_from_infection:
+                return infection.start_time + stage_time
+        return np.inf
+
+    def schedule(self, person: Person, time: float):
+        """
+        Schedules the next transition of person after time.
+        """
+        if person.id not in self.infected:
+            self.add_transmission(person)
+        self.infected[person.id] = person
+        transition_time = self.next_transition_time(person, time)
+        self.next_transition[person.id] = transition_time
+        if transition_time < np.inf:
+            heapq.heappush(self.heap, (transition_time, person.id))
+
+    def add_transmission(self, person: Person):
+        infection = person.health_information.infection
+        transmission = infection.transmission
+        if isinstance(transmission, TransmissionGamma):
+            idx = self.people_store.index_of(person.id)
+            self.people_store.set_gamma_transmission(idx, infection)
+            self.gamma_transmissions[idx] = transmission
+        elif not isinstance(transmission, TransmissionConstant):
+            self.other_transmissions[person.id] = person
+
+    def remove(self, person: Person):
+        self.infected.pop(person.id, None)
+        self.next_transition.pop(person.id, None)
+        self.gamma_transmissions.pop(self.people_store.index_of(person.id), None)
+        self.other_transmissions.pop(person.id, None)
+
+    def pop_due(self, until: float) -> List[Person]:
+        """
+        Removes from the heap and returns everyone with a transition before until.
+        """
+        due = []
+        while self.heap and self.heap[0][0] <= until:
+            transition_time, person_id = heapq.heappop(self.heap)
+            if self.next_transition.get(person_id) != transition_time:
+                continue
+            del self.next_transition[person_id]
+            due.append(self.infected[person_id])
+        return due
+
+    def update_transmission_probabilities(self, time: float):
+        """
+        Updates the transmission probability of everyone infected whose transmission
+        changes with time, whether or not their symptoms change. The probabilities
+        are also set on the transmission objects, which the interactive groups read.
+        """
+        people_store = self.people_store
+        if self.gamma_transmissions:
+            idx = np.fromiter(
+                self.gamma_transmissions.keys(), np.int64, len(self.gamma_transmissions)
+            )
+            probabilities = people_store.gamma_transmission_probabilities(idx, time)
+            people_store.transmission_probability[idx] = probabilities
+            for transmission, probability in zip(
+                self.gamma_transmissions.values(), probabilities.tolist()
+            ):
+                transmission.probability = probability
+        for person in self.other_transmissions.values():
+            infection = person.health_information.infection
+            infection.transmission.update_probability_from_delta_time(
+                time_from_infection=time - infection.start_time
+            )
+            people_store.transmission_probability[
+                people_store.index_of(person.id)
+            ] = infection.transmission.probability
@@ -0,0 +1,253 @@
+import hashlib
+import pickle
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+from sklearn.neighbors import BallTree
+
+from june.demography.geography_cache import savez_atomic
+from june.groups.leisure.social_venue import SocialVenues
+from june.groups.leisure.venue_table import TableBackedVenues, VenueViews
+
+earth_radius = 6371  # km
+
+
+def has_tree(venues: SocialVenues) -> bool:
+    """
+    Whether the venues have a ball tree, without building a lazily built one.
+    """
+    if isinstance(venues, TableBackedVenues):
+        return venues.has_tree
+    return getattr(venues, "ball_tree", None) is not None
+
+
+def venue_coordinates(venues: SocialVenues) -> np.array:
+    if isinstance(venues.members, VenueViews):
+        return venues.members.table.coordinates
+    return np.array([venue.coordinates for venue in venues.members]).reshape(-1, 2)
+
+
+class CandidateVenues:
+    """
+    Flat list of the candidate venues of all areas, creating venue views only for
+    the candidates that are actually picked.
+    """
+
+    def __init__(self, indices: np.array, venues: SocialVenues):
+        self.indices = indices
+        self.venues = venues
+
+    def __len__(self):
+        return len(self.indices)
+
+    def __getitem__(self, position: int):
+        return self.venues.members[self.indices[position]]
+
+
+class VenueCandidates:
+    """
+    Candidate venues of one venue type for every area, as CSR arrays: the candidates
+    of area a are venues.members[indices[offsets[a]:offsets[a+1]]]. As in
+    SocialVenueDistributor.get_possible_venues_for_area, they are a random subset of
+    (at most) neighbours_to_consider of the venues within maximum_distance km, or
+    the closest venue if there is none in range.
+    """
+
+    def __init__(self, offsets: np.array, indices: np.array, venues: SocialVenues):
+        self.offsets = offsets
+        self.indices = indices
+        self.venues = venues
+
+    @classmethod
+    def query(
+        cls,
+        venues: SocialVenues,
+        area_coordinates: np.array,
+        neighbours_to_consider: int,
+        maximum_distance: float,
+    ) -> "VenueCandidates":
+        """
+        Finds the candidates of all the areas with one ball tree query (plus one for
+        the closest venue of the areas with none in range).
+        """
+        n_areas = len(area_coordinates)
+        if not has_tree(venues) or n_areas == 0:
+            offsets = np.zeros(n_areas + 1, dtype=np.int64)
+            return cls(offsets, np.zeros(0, dtype=np.int64), venues)
+        area_coordinates = np.deg2rad(area_coordinates)
+        neighbours = list(
+            venues.ball_tree.query_radius(
+                area_coordinates, r=maximum_distance / earth_radius
+            )
+        )
+        out_of_range = [idx for idx, indices in enumerate(neighbours) if not len(indices)]
+        if out_of_range:
+            closest = venues.ball_tree.query(
+                area_coordinates[out_of_range], k=1, return_distance=False
+            )
+            for idx, indices in zip(out_of_range, closest):
+                neighbours[idx] = indices
+        neighbours = [
+            indices[
+                np.random.choice(
+                    len(indices),
+                    min(len(indices), neighbours_to_consider),
+                    replace=False,
+                )
+            ]
+            for indices in neighbours
+        ]
+        offsets = np.zeros(n_areas + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(indices) for indices in neighbours])
+        indices = np.concatenate(neighbours + [np.zeros(0, dtype=np.int64)])
+        return cls(offsets, indices.astype(np.int64), venues)
+
+    def venue_list(self) -> CandidateVenues:
+        return CandidateVenues(self.indices, self.venues)
+
+    def for_area(self, area_idx: int) -> tuple:
+        return tuple(
+            self.venues.members[idx]
+            for idx in self.indices[self.offsets[area_idx] : self.offsets[area_idx + 1]]
+        )
+
+
+class VenueCandidatesCache:
+    """
+    Stores the ball tree and the candidate arrays of every venue type in a directory
+    next to the world file (world.hdf5 -> world.venues/), keyed by a fingerprint of
+    the venue and area coordinates and the query parameters, so that reloading the
+    same world does not rebuild trees or query neighbours again.
+    """
+
+    def __init__(self, world_file_path: str):
+        self.path = Path(world_file_path).with_suffix(".venues")
+        self.path.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def fingerprint(
+        venue_coordinates: np.array,
+        area_coordinates: np.array,
+        neighbours_to_consider: int,
+        maximum_distance: float,
+    ) -> str:
+        digest = hashlib.sha1(np.ascontiguousarray(venue_coordinates).tobytes())
+        digest.update(np.ascontiguousarray(area_coordinates).tobytes())
+        digest.update(f"{neighbours_to_consider},{maximum_distance}".encode())
+        return digest.hexdigest()
+
+    def get(
+        self,
+        activity: str,
+        venues: SocialVenues,
+        area_coordinates: np.array,
+        neighbours_to_consider: int,
+        maximum_distance: float,
+    ) -> VenueCandidates:
+        coordinates = venue_coordinates(venues)
+        fingerprint = self.fingerprint(
+            coordinates, area_coordinates, neighbours_to_consider, maximum_distance
+        )
+        tree_file = self.path / f"{activity}_tree.pkl"
+        candidates_file = self.path / f"{activity}.npz"
+        if candidates_file.exists():
+            with np.load(candidates_file) as cached:
+                if str(cached["fingerprint"]) == fingerprint:
+                    if not has_tree(venues) and tree_file.exists():
+                        with open(tree_file, "rb") as f:
+                            venues.ball_tree = pickle.load(f)
+                    return VenueCandidates(cached["offsets"], cached["indices"], venues)
+        if not has_tree(venues) and len(coordinates):
+            venues.ball_tree = BallTree(np.deg2rad(coordinates), metric="haversine")
+        candidates = VenueCandidates.query(
+            venues, area_coordinates, neighbours_to_consider, maximum_distance
+        )
+        if has_tree(venues):
+            with open(tree_file, "wb") as f:
+                pickle.dump(venues.ball_tree, f, protocol=pickle.HIGHEST_PROTOCOL)
+        savez_atomic(
+            candidates_file,
+            offsets=candidates.offsets,
+            indices=candidates.indices,
+            fingerprint=np.array(fingerprint),
+        )
+        return candidates
+
+
+def query_venue_candidates(
+    leisure: "Leisure", areas: List["Area"], world_file_path: Optional[str] = None,
+) -> Dict[str, VenueCandidates]:
+    """
+    Candidate venues of every area for each leisure activity whose venues have
+    coordinates, with the distributor's neighbours_to_consider and maximum_distance.
+    Cached next to world_file_path if given (the random subsets are then drawn
+    once, like the households' social_venues of a saved world).
+
+    The result is stored as leisure.venue_candidates, which the
+    BatchedActivityManager uses instead of the households' social_venues.
+    """
+    area_coordinates = np.array([area.coordinates for area in areas]).reshape(-1, 2)
+    if world_file_path is not None:
+        cache = VenueCandidatesCache(world_file_path)
+    venue_candidates = {}
+    for activity, distributor in leisure.leisure_distributors.items():
+        venues = distributor.social_venues
+        if not isinstance(venues, SocialVenues):
+            continue
+        arguments = (
+            venues,
+            area_coordinates,
+            distributor.neighbours_to_consider,
+            distributor.maximum_distance,
+        )
+        if world_file_path is not None:
+            venue_candidates[activity] = cache.get(activity, *arguments)
+        else:
+            if not has_tree(venues) and len(venues.members):
+                venues.make_tree()
+            venue_candidates[activity] = VenueCandidates.query(*arguments)
+    leisure.venue_candidates = venue_candidates
+    return venue_candidates
+
+
+def assign_household_social_venues(
+    households: List["Household"],
+    areas: List["Area"],
+    venue_candidates: Dict[str, VenueCandidates],
+):
+    """
+    Sets the social_venues of every household from the candidates of its area, for
+    the activities in venue_candidates (for the per person ActivityManager; this
+    creates every candidate venue).
+    """
+    area_to_idx = {id(area): idx for idx, area in enumerate(areas)}
+    for household in households:
+        if not hasattr(household, "social_venues"):
+            household.social_venues = {}
+        area_idx = area_to_idx[id(household.area)]
+        for activity, candidates in venue_candidates.items():
+            household.social_venues[activity] = candidates.for_area(area_idx)
+
+
+def prepare_venue_candidates(
+    leisure: "Leisure", world: "World", assign_households: bool = True
+) -> Dict[str, VenueCandidates]:
+    """
+    Default load path of the leisure venues: queries the candidates of every area
+    (unless leisure already has them), cached next to the world file when the world
+    was loaded from one, and, for the per person ActivityManager, fills the
+    households' social_venues from them.
+    """
+    venue_candidates = getattr(leisure, "venue_candidates", None)
+    if venue_candidates is not None:
+        return venue_candidates
+    areas = world.areas.members
+    venue_candidates = query_venue_candidates(
+        leisure, areas, getattr(world, "file_path", None)
+    )
+    if assign_households and world.households is not None:
+        assign_household_social_venues(
+            world.households.members, areas, venue_candidates
+        )
+    return venue_candidates
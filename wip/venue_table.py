@@ -0,0 +1,186 @@
+from pathlib import Path
+from typing import List, Optional
+
+import numpy as np
+import pandas as pd
+from sklearn.neighbors import BallTree
+
+from june.demography.geography_cache import savez_atomic
+
+
+class VenueTable:
+    """
+    Coordinates and super area of every venue of a type, as arrays sorted by super
+    area with the row range of each super area, so that the venues of a set of
+    super areas are a few slices.
+
+    Tables read from a CSV file (super_area, lat, lon columns) are cached as an
+    .npz file next to it, rebuilt whenever the CSV file is newer.
+    """
+
+    def __init__(
+        self,
+        coordinates: np.array,
+        super_areas: Optional[np.array] = None,
+        super_area_names: Optional[np.array] = None,
+    ):
+        self.coordinates = np.asarray(coordinates, dtype=np.float64).reshape(-1, 2)
+        if super_areas is None:
+            super_areas = np.full(len(self.coordinates), -1, dtype=np.int32)
+            super_area_names = np.array([], dtype=str)
+        self.super_areas = super_areas
+        self.super_area_names = super_area_names
+        self.starts = np.searchsorted(
+            self.super_areas, np.arange(len(super_area_names) + 1)
+        )
+
+    def __len__(self):
+        return len(self.coordinates)
+
+    @classmethod
+    def from_csv(cls, filename: str) -> "VenueTable":
+        filename = Path(filename)
+        cache_filename = filename.with_suffix(".npz")
+        if (
+            cache_filename.exists()
+            and cache_filename.stat().st_mtime >= filename.stat().st_mtime
+        ):
+            with np.load(cache_filename) as cache:
+                return cls(
+                    cache["coordinates"],
+                    cache["super_areas"],
+                    cache["super_area_names"],
+                )
+        venues = pd.read_csv(filename)
+        super_area_names, super_areas = np.unique(
+            venues["super_area"].values.astype(str), return_inverse=True
+        )
+        order = np.argsort(super_areas, kind="stable")
+        coordinates = venues[["lat", "lon"]].values[order]
+        super_areas = super_areas[order].astype(np.int32)
+        savez_atomic(
+            cache_filename,
+            coordinates=coordinates,
+            super_areas=super_areas,
+            super_area_names=super_area_names,
+        )
+        return cls(coordinates, super_areas, super_area_names)
+
+    def for_super_areas(self, names: List[str]) -> "VenueTable":
+        """
+        Table of the venues in the given super areas.
+        """
+        names = np.asarray(names, dtype=str)
+        codes = np.searchsorted(self.super_area_names, names)
+        found = codes < len(self.super_area_names)
+        found[found] = self.super_area_names[codes[found]] == names[found]
+        codes = np.unique(codes[found])
+        rows = np.concatenate(
+            [np.arange(self.starts[code], self.starts[code + 1]) for code in codes]
+            + [np.zeros(0, dtype=np.int64)]
+        )
+        return VenueTable(
+            self.coordinates[rows],
+            np.searchsorted(codes, self.super_areas[rows]).astype(np.int32),
+            self.super_area_names[codes],
+        )
+
+
+class VenueViews:
+    """
+    The venues of a VenueTable as a sequence of venue objects, each created the
+    first time it is indexed (e.g. when someone is sent there).
+
+    len() counts every venue of the table, as indices (e.g. from the ball tree)
+    range over all of them, but iterating only goes over the venues created so far:
+    the others have never had visitors, so there is nothing to clear or time step
+    in them. Use created() for the number of venues iteration yields.
+    """
+
+    def __init__(self, table: VenueTable, venue_class: type):
+        self.table = table
+        self.venue_class = venue_class
+        self.venues = {}
+
+    def __len__(self):
+        """
+        Number of venues in the table, created or not.
+        """
+        return len(self.table)
+
+    def created(self) -> int:
+        """
+        Number of venues created so far, which is what iterating goes over.
+        """
+        return len(self.venues)
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self[i] for i in range(*idx.indices(len(self)))]
+        idx = int(idx)
+        if idx < 0:
+            idx += len(self)
+        venue = self.venues.get(idx)
+        if venue is None:
+            venue = self.venue_class()
+            venue.coordinates = self.table.coordinates[idx]
+            self.venues[idx] = venue
+        return venue
+
+    def __iter__(self):
+        """
+        Iterates over the venues created so far only (see created()).
+        """
+        return iter(list(self.venues.values()))
+
+    def occupancy(self) -> np.array:
+        """
+        Number of people currently in every venue.
+        """
+        occupancy = np.zeros(len(self), dtype=np.int32)
+        for idx, venue in self.venues.items():
+            occupancy[idx] = len(venue.people)
+        return occupancy
+
+
+class TableBackedVenues:
+    """
+    Mixin for SocialVenues whose members can be VenueViews over a VenueTable: the
+    ball tree is built straight from the table coordinates, without creating the
+    venues.
+
+    Venues built from a table do not build their tree up front: it is either
+    attached from a cache (see venue_candidates) or built the first time it is used.
+    """
+
+    venue_class = None
+    _ball_tree = None
+
+    @classmethod
+    def from_table(cls, table: VenueTable, **kwargs):
+        kwargs.setdefault("make_tree", False)
+        return cls(VenueViews(table, cls.venue_class), **kwargs)
+
+    @property
+    def ball_tree(self):
+        if self._ball_tree is None and len(self.members):
+            self.make_tree()
+        return self._ball_tree
+
+    @ball_tree.setter
+    def ball_tree(self, ball_tree):
+        self._ball_tree = ball_tree
+
+    @property
+    def has_tree(self) -> bool:
+        """
+        Whether the tree is built or attached, without building it.
+        """
+        return self._ball_tree is not None
+
+    def make_tree(self):
+        if not isinstance(self.members, VenueViews):
+            return super().make_tree()
+        self.ball_tree = BallTree(
+            np.deg2rad(self.members.table.coordinates), metric="haversine"
+        )